@@ -0,0 +1,124 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import csv
+import json
+import heapq
+import shutil
+import logging
+import tempfile
+from itertools import islice
+from typing import Iterator, List
+
+__all__ = ('CSVMergeWriter',)
+
+logger = logging.getLogger(__name__)
+
+# Rows of the existing file sort before the rows of the current run, so the new values win
+EXISTING, INCOMING = 0, 1
+
+
+class CSVMergeWriter:
+    """
+    Streams the rows of a run to a spool file and, on close(), merges them with the existing CSV file by
+    primary key using sorted runs of at most `chunk_size` rows. The result replaces the CSV file atomically,
+    so memory stays bounded and rows that were not fetched again are kept.
+    """
+
+    def __init__(self, csv_file_path: str, columns: List[str], key_columns: List[str], chunk_size: int = 100000):
+        self.csv_file_path = csv_file_path
+        self.columns = list(columns)
+        self.key_columns = key_columns
+        self.chunk_size = chunk_size
+
+        # Temporary files live next to the CSV file, os.replace() is atomic only within a file system
+        self.tmp_dir = tempfile.mkdtemp(prefix='.merge_', dir=os.path.dirname(os.path.abspath(csv_file_path)))
+        self.spool = open(os.path.join(self.tmp_dir, 'incoming.jsonl'), 'w', encoding='utf-8')
+        self.runs = 0
+
+    def append(self, data: dict):
+        self.columns.extend(key for key in data.keys() if key not in self.columns)
+        self.spool.write(json.dumps(data, default=str) + '\n')
+
+    def sort_key(self, row: dict) -> tuple:
+        return tuple('' if row.get(column) is None else str(row.get(column)) for column in self.key_columns)
+
+    def read_existing(self) -> Iterator[dict]:
+        with open(self.csv_file_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            self.columns.extend(column for column in reader.fieldnames or [] if column not in self.columns)
+            for row in reader:
+                yield {k: (v if v != '' else None) for k, v in row.items()}
+
+    def read_incoming(self) -> Iterator[dict]:
+        with open(self.spool.name, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def sorted_runs(self, rows: Iterator[dict], priority: int) -> List[str]:
+        run_files = []
+        seq = 0
+        while True:
+            chunk = []
+            for row in islice(rows, self.chunk_size):
+                chunk.append((self.sort_key(row), priority, seq, row))
+                seq += 1
+            if not chunk:
+                return run_files
+
+            chunk.sort(key=lambda item: item[:3])
+            self.runs += 1
+            run_file = os.path.join(self.tmp_dir, f'run_{self.runs}.jsonl')
+            with open(run_file, 'w', encoding='utf-8') as f:
+                for item in chunk:
+                    f.write(json.dumps(item, default=str) + '\n')
+            run_files.append(run_file)
+
+    @staticmethod
+    def read_run(run_file: str) -> Iterator[tuple]:
+        with open(run_file, encoding='utf-8') as f:
+            for line in f:
+                key, priority, seq, row = json.loads(line)
+                yield tuple(key), priority, seq, row
+
+    def merged_rows(self, run_files: List[str]) -> Iterator[dict]:
+        current_key, current_row = None, None
+        for key, _, _, row in heapq.merge(*map(self.read_run, run_files), key=lambda item: item[:3]):
+            if key != current_key:
+                if current_row is not None:
+                    yield current_row
+                current_key, current_row = key, dict()
+            current_row.update(row)
+        if current_row is not None:
+            yield current_row
+
+    def close(self):
+        self.spool.close()
+        try:
+            run_files = []
+            if os.path.exists(self.csv_file_path):
+                run_files.extend(self.sorted_runs(self.read_existing(), EXISTING))
+            run_files.extend(self.sorted_runs(self.read_incoming(), INCOMING))
+
+            output_path = os.path.join(self.tmp_dir, 'output.csv')
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=self.columns)
+                writer.writeheader()
+                writer.writerows(self.merged_rows(run_files))
+
+            os.replace(output_path, self.csv_file_path)
+            logger.debug(f"Merged {len(run_files)} sorted runs into {self.csv_file_path}")
+        finally:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
@@ -19,119 +19,54 @@ from datetime import date
 
 __all__ = ('CSVFileHelper',)
 
+from utils.types import FetcherType
 from utils.adapter.abstract_adapter import AbstractAdapter
+from adapters.csv_merge import CSVMergeWriter
+from utils.schema import get_schema, key_columns, primary_key
 
 logger = logging.getLogger(__name__)
 
-colnames = {
-    'government_response': [
-        'source', 'date', 'gid', 'country', 'countrycode', 'adm_area_1', 'adm_area_2', 'adm_area_3',
-        'c1_school_closing', 'c1_flag',
-        'c2_workplace_closing', 'c2_flag',
-        'c3_cancel_public_events', 'c3_flag',
-        'c4_restrictions_on_gatherings', 'c4_flag',
-        'c5_close_public_transport', 'c5_flag',
-        'c6_stay_at_home_requirements', 'c6_flag',
-        'c7_restrictions_on_internal_movement', 'c7_flag',
-        'c8_international_travel_controls',
-        'e1_income_support', 'e1_flag',
-        'e2_debtcontract_relief',
-        'e3_fiscal_measures',
-        'e4_international_support',
-        'h1_public_information_campaigns', 'h1_flag',
-        'h2_testing_policy',
-        'h3_contact_tracing',
-        'h4_emergency_investment_in_healthcare',
-        'h5_investment_in_vaccines',
-        'm1_wildcard',
-        'stringency_index',
-        'stringency_indexfordisplay',
-        'stringency_legacy_index',
-        'stringency_legacy_indexfordisplay',
-        'government_response_index',
-        'government_response_index_for_display',
-        'containment_health_index',
-        'containment_health_index_for_display',
-        'economic_support_index',
-        'economic_support_index_for_display'
-    ],
-    'epidemiology': [
-        'source', 'date', 'country', 'countrycode', 'adm_area_1',
-        'adm_area_2', 'adm_area_3', 'gid', 'tested', 'confirmed',
-        'recovered', 'dead', 'hospitalised', 'hospitalised_icu', 'quarantined'
-    ],
-    'epidemiology_england_msoa': [
-        'source', 'date', 'country', 'countrycode', 'adm_area_1',
-        'adm_area_2', 'adm_area_3', 'msoa', 'msoa_code', 'confirmed',
-        'dead', 'population'
-    ],
-    'mobility': [
-        'source', 'date', 'country', 'countrycode', 'adm_area_1',
-        'adm_area_2', 'adm_area_3', 'gid', 'transit_stations', 'residential',
-        'workplace', 'parks', 'retail_recreation', 'grocery_pharmacy'
-    ],
-    'weather': [
-        'source', 'date', 'gid', 'country', 'countrycode', 'adm_area_1',
-        'adm_area_2', 'adm_area_3', 'samplesize', 'precipitation_max_avg',
-        'precipitation_max_std', 'precipitation_mean_avg',
-        'precipitation_mean_std', 'humidity_max_avg', 'humidity_max_std',
-        'humidity_mean_avg', 'humidity_mean_std', 'humidity_min_avg',
-        'humidity_min_std', 'sunshine_max_avg', 'sunshine_max_std',
-        'sunshine_mean_avg', 'sunshine_mean_std', 'temperature_max_avg',
-        'temperature_max_std', 'temperature_mean_avg', 'temperature_mean_std',
-        'temperature_min_avg', 'temperature_min_std', 'windgust_max_avg',
-        'windgust_max_std', 'windgust_mean_avg', 'windgust_mean_std',
-        'windgust_min_avg', 'windgust_min_std', 'windspeed_max_avg',
-        'windspeed_max_std', 'windspeed_mean_avg', 'windspeed_mean_std',
-        'windspeed_min_avg', 'windspeed_min_std',
-        'cloudaltitude_max_valid',
-        'cloudaltitude_max_avg', 'cloudaltitude_max_std',
-        'cloudaltitude_min_valid',
-        'cloudaltitude_min_avg', 'cloudaltitude_min_std',
-        'cloudaltitude_mean_valid',
-        'cloudaltitude_mean_avg', 'cloudaltitude_mean_std',
-        'cloudfrac_max_avg', 'cloudfrac_max_std',
-        'cloudfrac_min_avg', 'cloudfrac_min_std', 'cloudfrac_mean_avg',
-        'cloudfrac_mean_std'
-    ],
-    "diagnostics": [
-        "table_name", "source", "validation_success",
-        "error", "last_run_start", "last_run_stop",
-        "first_timestamp", "last_timestamp"
-    ]
-}
-
 
 class CSVFileHelper(AbstractAdapter):
-    def __init__(self, csv_path: str):
+    def __init__(self, csv_path: str, merge: bool = False):
         self.csv_path = csv_path
+        self.merge = merge
         self.csv_file_name = None
-        self.temp_df = None
+        self.data_type = None
+        self.rows = None
+        self.merge_writer = None
+
+    def fingerprint_target(self) -> str:
+        # Without merge every flush rewrites the file with the rows of the run only
+        return f'csv:{os.path.abspath(self.csv_path)}' if self.merge else None
 
-    def upsert_temp_df(self, csv_file_name: str, data_type: str, data: dict):
+    def upsert_row(self, csv_file_name: str, data_type: str, data: dict):
         if self.csv_file_name != csv_file_name:
-            self.flush()
+            self.flush_data()
             self.csv_file_name = csv_file_name
-            self.temp_df = pd.DataFrame(columns=colnames.get(data_type))
-
-        # check if row exists
-        row = self.temp_df[
-            (self.temp_df.date == data.get('date')) & \
-            (self.temp_df.countrycode == data.get('countrycode')) & \
-            (self.temp_df.adm_area_1 == data.get('adm_area_1')) & \
-            (self.temp_df.adm_area_2 == data.get('adm_area_2')) & \
-            (self.temp_df.adm_area_3 == data.get('adm_area_3'))
-            ]
-        if data_type == 'epidemiology_england_msoa':
-            row = row[(self.temp_df.msoa == data.get('msoa'))]
-        row = row.index.tolist()
-
+            self.data_type = data_type
+            if self.merge:
+                self.merge_writer = CSVMergeWriter(os.path.join(self.csv_path, csv_file_name),
+                                                   get_schema(data_type).column_names, key_columns(data_type))
+            else:
+                self.rows = dict()
+
+        if self.merge_writer:
+            self.merge_writer.append(data)
+            return
+
+        key = primary_key(data_type, data)
+        row = self.rows.get(key)
         if row:
-            series = self.temp_df.iloc[row[0]]
-            for key, value in data.items():
-                series[key] = value
+            row.update(data)
         else:
-            self.temp_df = self.temp_df.append(data, ignore_index=True)
+            self.rows[key] = dict(data)
+
+    def get_columns(self) -> list:
+        columns = get_schema(self.data_type).column_names
+        for row in self.rows.values():
+            columns.extend(key for key in row.keys() if key not in columns)
+        return columns
 
     def format_data(self, data):
         if isinstance(data.get('date'), pd.Timestamp):
@@ -151,9 +86,19 @@ class CSVFileHelper(AbstractAdapter):
         self.check_if_gid_exists(kwargs)
         csv_file_name = f'{table_name}_{kwargs.get("source")}.csv'
         kwargs = self.format_data(kwargs)
-        self.upsert_temp_df(csv_file_name, table_name, kwargs)
+        self.upsert_row(csv_file_name, table_name, kwargs)
         logger.debug("Updating {} table with data: {}".format(table_name, list(kwargs.values())))
 
+    def write_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        table_name = self.correct_table_name(fetcher_type.value)
+        df = self.format_frame(df)
+
+        for source, rows in df.groupby('source', sort=False):
+            csv_file_name = f'{table_name}_{source}.csv'
+            for row in self.frame_records(rows):
+                self.upsert_row(csv_file_name, table_name, row)
+        logger.debug(f"Updating {table_name} table with {len(df)} rows")
+
     def upsert_government_response_data(self, table_name: str = 'government_response', **kwargs):
         self.upsert_table_data(table_name, **kwargs)
 
@@ -170,10 +115,17 @@ class CSVFileHelper(AbstractAdapter):
         # TODO: Implement get division
         raise NotImplementedError("To be implemented")
 
-    def flush(self):
-        if self.csv_file_name and self.temp_df is not None:
+    def flush_data(self):
+        if self.merge_writer:
+            self.merge_writer.close()
+            logger.debug(f"Merged CSV {self.merge_writer.csv_file_path}")
+        elif self.csv_file_name and self.rows is not None:
             csv_file_path = os.path.join(self.csv_path, self.csv_file_name)
-            self.temp_df.to_csv(csv_file_path, index=False, header=True)
+            temp_df = pd.DataFrame(list(self.rows.values()), columns=self.get_columns())
+            temp_df = get_schema(self.data_type).coerce_frame(temp_df)
+            temp_df.to_csv(csv_file_path, index=False, header=True)
             logger.debug(f"Saving to CSV {csv_file_path}")
         self.csv_file_name = None
-        self.temp_df = None
+        self.data_type = None
+        self.rows = None
+        self.merge_writer = None
@@ -0,0 +1,166 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from functools import partial
+from typing import List
+import pandas as pd
+from utils.types import FetcherType
+
+__all__ = ('FanOutHelper',)
+
+from utils.adapter.abstract_adapter import AbstractAdapter
+from utils.adapter.background_writer import BackgroundWriter
+
+logger = logging.getLogger(__name__)
+
+
+class FanOutHelper(AbstractAdapter):
+    """
+    Sends every upsert to several adapters, each one fed by its own writer thread with a bounded queue.
+    A slow adapter holds up the fetcher only once its queue is full. Reads go to the first (primary) adapter,
+    right away if its reads are thread safe, otherwise queued behind its pending writes on its writer thread.
+    """
+
+    def __init__(self, adapters: List[AbstractAdapter], queue_size: int = 10000):
+        if not adapters:
+            raise ValueError('At least one adapter is required')
+        self.adapters = adapters
+        self.writers = [BackgroundWriter(partial(self.write_batch, adapter), maxsize=queue_size,
+                                         name=f'fanout-{type(adapter).__name__}')
+                        for adapter in adapters]
+
+    @staticmethod
+    def write_batch(adapter: AbstractAdapter, batch: List):
+        for fetcher_type, data in batch:
+            if isinstance(data, pd.DataFrame):
+                # Frames are validated and converted once by FanOutHelper.upsert_frame()
+                adapter.write_frame(fetcher_type, data)
+            else:
+                adapter.upsert_data(fetcher_type, **data)
+
+    def call_primary(self, fn_name: str, *args, **kwargs):
+        return self.writers[0].call(getattr(self.adapters[0], fn_name), *args, **kwargs)
+
+    def read_primary(self, fn_name: str, *args, **kwargs):
+        # Lookups while parsing don't wait for the pending writes of the primary
+        if self.adapters[0].thread_safe_reads:
+            return getattr(self.adapters[0], fn_name)(*args, **kwargs)
+        return self.call_primary(fn_name, *args, **kwargs)
+
+    def call_all(self, fn_name: str, *args, **kwargs) -> List:
+        # Submit to all writers first, so that the adapters run the call in parallel
+        tasks = [writer.submit(getattr(adapter, fn_name), *args, **kwargs)
+                 for adapter, writer in zip(self.adapters, self.writers)]
+        return [task.wait() for task in tasks]
+
+    def fingerprint_target(self) -> str:
+        # A row is only skipped if every adapter has it
+        targets = [adapter.fingerprint_target() for adapter in self.adapters]
+        return None if None in targets else '|'.join(targets)
+
+    def start_write_behind(self, queue_size: int = 10000):
+        # Every adapter is already written by its own thread
+        pass
+
+    def upsert_data(self, fetcher_type: FetcherType, **kwargs):
+        if self.skip_row(fetcher_type, kwargs):
+            return
+        for writer in self.writers:
+            writer.put((fetcher_type, kwargs))
+
+    def write_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        for writer in self.writers:
+            writer.put((fetcher_type, df))
+
+    def upsert_government_response_data(self, table_name: str = 'government_response', **kwargs):
+        self.upsert_data(FetcherType.GOVERNMENT_RESPONSE, **kwargs)
+
+    def upsert_epidemiology_data(self, table_name: str = 'epidemiology', **kwargs):
+        self.upsert_data(FetcherType.EPIDEMIOLOGY, **kwargs)
+
+    def upsert_mobility_data(self, table_name: str = 'mobility', **kwargs):
+        self.upsert_data(FetcherType.MOBILITY, **kwargs)
+
+    def upsert_weather_data(self, table_name: str = 'weather', **kwargs):
+        self.upsert_data(FetcherType.WEATHER, **kwargs)
+
+    def upsert_diagnostics(self, **kwargs):
+        for adapter, writer in zip(self.adapters, self.writers):
+            try:
+                writer.call(adapter.upsert_diagnostics, **kwargs)
+            except NotImplementedError:
+                logger.debug(f'{type(adapter).__name__} does not store diagnostics')
+
+    def get_adm_division(self, countrycode: str, adm_area_1: str = None, adm_area_2: str = None,
+                         adm_area_3: str = None):
+        return self.read_primary('get_adm_division', countrycode, adm_area_1, adm_area_2, adm_area_3)
+
+    def reset_adm_division_cache(self):
+        super().reset_adm_division_cache()
+        self.call_primary('reset_adm_division_cache')
+
+    def get_adm_divisions(self, countrycode: str):
+        return self.read_primary('get_adm_divisions', countrycode)
+
+    def get_data(self, table_name: str, source: str, date: str, gid: str):
+        return self.read_primary('get_data', table_name, source, date, gid)
+
+    def get_earliest_timestamp(self, table_name: str, source: str = None):
+        return self.read_primary('get_earliest_timestamp', table_name, source)
+
+    def get_latest_timestamp(self, table_name: str, source: str = None):
+        return self.read_primary('get_latest_timestamp', table_name, source)
+
+    def get_details(self, table_name: str, source: str = None):
+        return self.read_primary('get_details', table_name, source)
+
+    def set_sliding_window(self, source: str, days: int):
+        # The adapters filter the upserts they are handed
+        super().set_sliding_window(source, days)
+        self.call_all('set_sliding_window', source, days)
+
+    def tracks_revisions(self, table_name: str) -> bool:
+        return super().tracks_revisions(table_name) or \
+            any(adapter.tracks_revisions(table_name) for adapter in self.adapters)
+
+    def pop_revision(self, source: str):
+        revisions = [revision for revision in self.call_all('pop_revision', source) + [super().pop_revision(source)]
+                     if revision]
+        return min(revisions, default=None)
+
+    def reset_upsert_stats(self):
+        self.call_all('reset_upsert_stats')
+
+    def publish_upsert_stats(self, source: str):
+        self.call_all('publish_upsert_stats', source)
+
+    def flush_data(self):
+        self.call_all('flush')
+        # Raise the errors of upserts that failed in the background
+        for writer in self.writers:
+            writer.raise_error()
+
+    def call_db_function_compare(self, source_code: str) -> bool:
+        return self.call_primary('call_db_function_compare', source_code)
+
+    def call_db_function_send_data(self, source_code: str):
+        return self.call_primary('call_db_function_send_data', source_code)
+
+    def truncate_staging(self, source_code: str = None):
+        self.call_all('truncate_staging', source_code)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
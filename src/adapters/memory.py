@@ -0,0 +1,147 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import hashlib
+import logging
+from datetime import date, datetime
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import pandas as pd
+
+__all__ = ('MemoryHelper',)
+
+from utils.adapter.abstract_adapter import AbstractAdapter
+from utils.schema import primary_key
+
+logger = logging.getLogger(__name__)
+
+
+def to_date(value) -> date:
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value.split(' ')[0].split('T')[0], '%Y-%m-%d').date()
+    return value
+
+
+def normalize_area(value) -> str:
+    return value.lower().replace(' ', '') if isinstance(value, str) else ''
+
+
+def fingerprint(data: Dict) -> int:
+    digest = hashlib.blake2b(repr(sorted(data.items())).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class MemoryHelper(AbstractAdapter):
+    """
+    Keeps the upserted rows in memory, or with keep_rows=False only counts and fingerprints them, so that
+    fetchers can be timed and profiled without a database. The fingerprint of a table and source is
+    independent of the order of the upserts and can be compared between runs.
+    """
+
+    def __init__(self, keep_rows: bool = True):
+        self.keep_rows = keep_rows
+        self.tables = defaultdict(dict)
+        self.stats = defaultdict(lambda: {'rows': 0, 'fingerprint': 0, 'countries': dict()})
+        self.adm_divisions = dict()
+        self.diagnostics = dict()
+
+    def get_adm_division(self, countrycode: str, adm_area_1: str = None, adm_area_2: str = None,
+                         adm_area_3: str = None) -> Tuple:
+        key = (countrycode, normalize_area(adm_area_1), normalize_area(adm_area_2), normalize_area(adm_area_3))
+        if key not in self.adm_divisions:
+            raise Exception(f'Unable to find adm division for: {countrycode}, {adm_area_1}, {adm_area_2}, {adm_area_3}')
+        return self.adm_divisions[key]
+
+    def tracks_revisions(self, table_name: str) -> bool:
+        return (self.keep_rows and not table_name.startswith('staging_')) or super().tracks_revisions(table_name)
+
+    def get_adm_divisions(self, countrycode: str) -> List[Tuple]:
+        return [division for key, division in self.adm_divisions.items() if key[0] == countrycode]
+
+    def upsert_table_data(self, table_name: str, **kwargs):
+        self.check_if_gid_exists(kwargs)
+        source = kwargs.get('source')
+        row_date = to_date(kwargs.get('date'))
+
+        stats = self.stats[(table_name, source)]
+        stats['rows'] += 1
+        # A sum instead of xor, so that repeated upserts of the same row don't cancel out
+        stats['fingerprint'] = (stats['fingerprint'] + fingerprint(kwargs)) % (1 << 64)
+        min_date, max_date = stats['countries'].get(kwargs.get('country'), (row_date, row_date))
+        stats['countries'][kwargs.get('country')] = (min(min_date, row_date), max(max_date, row_date))
+
+        if kwargs.get('gid'):
+            key = (kwargs.get('countrycode'), normalize_area(kwargs.get('adm_area_1')),
+                   normalize_area(kwargs.get('adm_area_2')), normalize_area(kwargs.get('adm_area_3')))
+            self.adm_divisions[key] = (kwargs.get('country'), kwargs.get('adm_area_1'), kwargs.get('adm_area_2'),
+                                       kwargs.get('adm_area_3'), kwargs.get('gid'))
+
+        if self.keep_rows:
+            key = (source,) + primary_key(table_name, dict(kwargs, date=row_date))
+            row = self.tables[table_name].get(key)
+            if row is not None and any(row.get(column) != value for column, value in kwargs.items()):
+                self.count_revision(source, row_date)
+            self.tables[table_name].setdefault(key, dict()).update(kwargs)
+
+    def upsert_government_response_data(self, table_name: str = 'government_response', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_epidemiology_data(self, table_name: str = 'epidemiology', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_mobility_data(self, table_name: str = 'mobility', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_weather_data(self, table_name: str = 'weather', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_diagnostics(self, **kwargs):
+        self.diagnostics[(kwargs.get('table_name'), kwargs.get('source'))] = kwargs
+
+    def get_data(self, table_name: str, source: str, date: str, gid: str):
+        for row in self.tables[table_name].values():
+            if row.get('source') == source and to_date(row.get('date')) == to_date(date) and row.get('gid') == gid:
+                return row
+        return None
+
+    def get_country_dates(self, table_name: str, source: str = None) -> Dict:
+        country_dates = dict()
+        for (stats_table_name, stats_source), stats in self.stats.items():
+            if stats_table_name != table_name or (source and stats_source != source):
+                continue
+            for country, (min_date, max_date) in stats['countries'].items():
+                previous_min, previous_max = country_dates.get(country, (min_date, max_date))
+                country_dates[country] = (min(previous_min, min_date), max(previous_max, max_date))
+        return country_dates
+
+    def get_earliest_timestamp(self, table_name: str, source: str = None):
+        return min((dates[0] for dates in self.get_country_dates(table_name, source).values()), default=None)
+
+    def get_latest_timestamp(self, table_name: str, source: str = None):
+        return max((dates[1] for dates in self.get_country_dates(table_name, source).values()), default=None)
+
+    def get_details(self, table_name: str, source: str = None):
+        details = [{'country': country, 'min_date': min_date.isoformat(), 'max_date': max_date.isoformat()}
+                   for country, (min_date, max_date) in self.get_country_dates(table_name, source).items()]
+        return json.dumps(details)
+
+    def flush_data(self):
+        for (table_name, source), stats in self.stats.items():
+            if stats['rows'] != stats.get('flushed_rows'):
+                stats['flushed_rows'] = stats['rows']
+                logger.info(f"{table_name} {source}: {stats['rows']} rows upserted, "
+                            f"fingerprint {stats['fingerprint']:016x}")
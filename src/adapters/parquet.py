@@ -0,0 +1,193 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import logging
+from pathlib import Path
+from datetime import date, datetime
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import pandas as pd
+
+__all__ = ('ParquetFileHelper',)
+
+from utils.types import FetcherType
+from utils.adapter.abstract_adapter import AbstractAdapter
+from utils.schema import get_schema, key_columns
+
+logger = logging.getLogger(__name__)
+
+
+def format_date(value) -> str:
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value.split(' ')[0].split('T')[0]
+    return value
+
+
+def format_key_value(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)) or value is pd.NA:
+        return None
+    return value
+
+
+class ParquetFileHelper(AbstractAdapter):
+    """
+    Writes every table as Parquet files partitioned by source and month:
+    <parquet_path>/<table>/source=<source>/month=<YYYY-MM>/data.parquet
+    An upsert rewrites only the partitions touched by the run.
+    """
+
+    def __init__(self, parquet_path: str):
+        self.parquet_path = parquet_path
+        self.partitions = defaultdict(dict)
+
+    def fingerprint_target(self) -> str:
+        return f'parquet:{os.path.abspath(self.parquet_path)}'
+
+    @staticmethod
+    def primary_key(table_name: str, data: Dict) -> Tuple:
+        return tuple(format_date(data.get(column)) if column == 'date' else format_key_value(data.get(column))
+                     for column in key_columns(table_name))
+
+    def partition_path(self, table_name: str, source: str, month: str = None) -> Path:
+        path = Path(self.parquet_path, table_name, f'source={source}')
+        return path / f'month={month}' if month else path
+
+    def format_data(self, data: Dict) -> Dict:
+        data['date'] = format_date(data.get('date'))
+        data['gid'] = ":".join(data.get('gid', [])) if data.get('gid') else None
+        if isinstance(data.get('actions'), (dict, list)):
+            data['actions'] = json.dumps(data.get('actions'))
+        return data
+
+    def get_adm_division(self, countrycode: str, adm_area_1: str = None, adm_area_2: str = None,
+                         adm_area_3: str = None):
+        # Parquet output has no administrative division table to look areas up in
+        raise Exception(f'Unable to find adm division for: {countrycode}, {adm_area_1}, {adm_area_2}, {adm_area_3}')
+
+    def upsert_table_data(self, table_name: str, **kwargs):
+        self.check_if_gid_exists(kwargs)
+        kwargs = self.format_data(kwargs)
+        partition = (table_name, kwargs.get('source'), kwargs.get('date')[:7])
+        rows = self.partitions[partition]
+
+        key = self.primary_key(table_name, kwargs)
+        if key in rows:
+            rows[key].update(kwargs)
+        else:
+            rows[key] = dict(kwargs)
+        logger.debug("Updating {} table with data: {}".format(table_name, list(kwargs.values())))
+
+    def write_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        table_name = self.correct_table_name(fetcher_type.value)
+        df = self.format_frame(df)
+
+        for (source, month), rows in df.groupby([df['source'], df['date'].str[:7]], sort=False):
+            partition = self.partitions[(table_name, source, month)]
+            for row in self.frame_records(rows):
+                key = self.primary_key(table_name, row)
+                if key in partition:
+                    partition[key].update(row)
+                else:
+                    partition[key] = row
+        logger.debug(f"Updating {table_name} table with {len(df)} rows")
+
+    def upsert_government_response_data(self, table_name: str = 'government_response', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_epidemiology_data(self, table_name: str = 'epidemiology', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_mobility_data(self, table_name: str = 'mobility', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_weather_data(self, table_name: str = 'weather', **kwargs):
+        self.upsert_table_data(table_name, **kwargs)
+
+    def upsert_diagnostics(self, **kwargs):
+        # One row per table and source in <parquet_path>/diagnostics.parquet, written right away
+        file_path = Path(self.parquet_path, 'diagnostics.parquet')
+        schema = get_schema('diagnostics')
+        rows = dict()
+        if file_path.exists():
+            rows = {(row['table_name'], row['source']): row for row in pd.read_parquet(file_path).to_dict('records')}
+        rows[(kwargs.get('table_name'), kwargs.get('source'))] = kwargs
+
+        df = schema.coerce_frame(pd.DataFrame(list(rows.values()), columns=schema.column_names))
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file_path = file_path.with_name('.diagnostics.parquet.tmp')
+        df.to_parquet(tmp_file_path, index=False)
+        os.replace(tmp_file_path, file_path)
+        logger.debug("Updating diagnostics with data: {}".format(list(kwargs.values())))
+
+    def write_partition(self, table_name: str, source: str, month: str, rows: Dict):
+        path = self.partition_path(table_name, source, month)
+        file_path = path / 'data.parquet'
+
+        if file_path.exists():
+            existing = pd.read_parquet(file_path)
+            existing['date'] = existing['date'].dt.strftime('%Y-%m-%d')
+            existing_rows = {self.primary_key(table_name, row): row for row in existing.to_dict('records')}
+            for key, row in rows.items():
+                existing_rows[key] = {**existing_rows.get(key, {}), **row}
+            rows = existing_rows
+
+        schema = get_schema(table_name)
+        columns = schema.column_names
+        for row in rows.values():
+            columns.extend(key for key in row.keys() if key not in columns)
+        # source and month are stored in the directory names
+        columns = [column for column in columns if column != 'source']
+
+        df = schema.coerce_frame(pd.DataFrame(list(rows.values()), columns=columns))
+        df = df.sort_values(by=['date']).reset_index(drop=True)
+
+        path.mkdir(parents=True, exist_ok=True)
+        tmp_file_path = path / '.data.parquet.tmp'
+        df.to_parquet(tmp_file_path, index=False)
+        os.replace(tmp_file_path, file_path)
+        logger.debug(f"Saving to Parquet {file_path}")
+
+    def flush_data(self):
+        for (table_name, source, month), rows in self.partitions.items():
+            self.write_partition(table_name, source, month, rows)
+        self.partitions = defaultdict(dict)
+
+    def read_table(self, table_name: str, source: str = None, columns: List = None) -> pd.DataFrame:
+        path = self.partition_path(table_name, source) if source else Path(self.parquet_path, table_name)
+        if not path.exists():
+            return None
+        return pd.read_parquet(path, columns=columns)
+
+    def get_earliest_timestamp(self, table_name: str, source: str = None):
+        df = self.read_table(table_name, source, columns=['date'])
+        return df.date.min().date() if df is not None and len(df) else None
+
+    def get_latest_timestamp(self, table_name: str, source: str = None):
+        df = self.read_table(table_name, source, columns=['date'])
+        return df.date.max().date() if df is not None and len(df) else None
+
+    def get_details(self, table_name: str, source: str = None):
+        # First and last date per country, as PostgresqlHelper.get_details()
+        df = self.read_table(table_name, source, columns=['country', 'date'])
+        if df is None:
+            return json.dumps([])
+        dates = df.groupby('country', observed=True)['date'].agg(['min', 'max'])
+        return json.dumps([{'country': country, 'min_date': row['min'].date().isoformat(),
+                            'max_date': row['max'].date().isoformat()} for country, row in dates.iterrows()])
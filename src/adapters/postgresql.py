@@ -12,19 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 import time
 import json
 import datetime
 import logging
-from typing import Tuple, List
+import threading
+from typing import Dict, Tuple, List
 import psycopg2.extras
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import pandas as pd
 
+from utils.config import config
+from utils.types import FetcherType
 from utils.adapter.abstract_adapter import AbstractAdapter
+from adapters.postgresql_schema import PostgresqlSchemaManager, conflict_target, partition_name
+from utils.schema import get_schema
 
 MAX_ATTEMPT_FAIL = 10
 
+# Columns without an equality operator, compared through their text representation
+JSON_COLUMNS = ['actions']
+
 __all__ = ('PostgresqlHelper',)
 
 logger = logging.getLogger(__name__)
@@ -35,7 +45,26 @@ def default(o):
         return o.isoformat()
 
 
+def normalize_adm_area(value: str) -> str:
+    # As regexp_replace(value, '[^\w%]+', '', 'g') compared with ILIKE by the query of get_adm_division()
+    return re.sub(r'[^\w%]+', '', value or '').lower()
+
+
+def values_changed(table_name: str, columns: List) -> sql.Composable:
+    def column(table: sql.Composable, name: str) -> sql.Composable:
+        if name in JSON_COLUMNS:
+            return sql.SQL("{}.{}::text").format(table, sql.Identifier(name))
+        return sql.SQL("{}.{}").format(table, sql.Identifier(name))
+
+    return sql.SQL("({}) IS DISTINCT FROM ({})").format(
+        sql.SQL(",").join(column(sql.Identifier(table_name), k) for k in columns),
+        sql.SQL(",").join(column(sql.SQL("EXCLUDED"), k) for k in columns)
+    )
+
+
 class PostgresqlHelper(AbstractAdapter):
+    thread_safe_reads = True
+
     def __init__(self, user: str, password: str, host: str, port: str, database_name: str):
         self.user = user
         self.password = password
@@ -45,9 +74,23 @@ class PostgresqlHelper(AbstractAdapter):
 
         self.conn = None
         self.cur = None
+        self.reset_adm_division_cache()
+        # Serializes the cursor between the fetcher and the write-behind thread
+        self.lock = threading.RLock()
         self.open_connection()
         self.cursor()
 
+        # Diagnostics read sql/source_watermark.sql instead of scanning the fact tables when it is installed
+        self.use_watermarks = self.watermarks_available()
+
+        self.schema = None
+        if config.DB_MANAGE_SCHEMA:
+            self.schema = PostgresqlSchemaManager(self, partition_by_date=config.DB_PARTITION_BY_DATE)
+            self.schema.migrate()
+
+    def fingerprint_target(self) -> str:
+        return f'postgresql://{self.user}@{self.host}:{self.port}/{self.database_name}'
+
     def reset_connection(self):
         self.close_connection()
         self.open_connection()
@@ -77,38 +120,101 @@ class PostgresqlHelper(AbstractAdapter):
             return self.cur
 
     def execute(self, query: str, data: str = None, attempt: int = MAX_ATTEMPT_FAIL):
-        try:
-            self.cur.execute(query, data)
-            self.conn.commit()
-        except (psycopg2.DatabaseError, psycopg2.OperationalError) as error:
-            if attempt > 0:
-                logger.error(f"Got error: {error}, query: {query}, data {data}, retrying")
-                time.sleep(1)
-                self.reset_connection()
-                self.execute(query, data, attempt - 1)
-            else:
+        with self.lock:
+            try:
+                self.cur.execute(query, data)
+                self.conn.commit()
+            except (psycopg2.DatabaseError, psycopg2.OperationalError) as error:
+                if attempt > 0:
+                    logger.error(f"Got error: {error}, query: {query}, data {data}, retrying")
+                    time.sleep(1)
+                    self.reset_connection()
+                    self.execute(query, data, attempt - 1)
+                else:
+                    raise error
+            except (Exception, psycopg2.Error) as error:
                 raise error
-        except (Exception, psycopg2.Error) as error:
-            raise error
-        return self.cur.fetchall()
+            return self.cur.fetchall()
 
     def call_db_function_compare(self, source_code: str) -> int:
-        self.cur.callproc('covid19_compare_tables', (source_code,))
-        logger.debug("Validating incoming data...")
-        compare_result = self.cur.fetchone()
+        # Compares only the dates staged for the source, see sql/covid19_validation_window.sql
+        with self.lock:
+            self.cur.callproc('covid19_validation_window', (source_code,))
+            logger.debug("Validating incoming data...")
+            compare_result = self.cur.fetchone()
         return compare_result[0]
 
     def call_db_function_send_data(self, source_code: str):
-        self.cur.callproc('send_validated_data', [source_code])
+        with self.lock:
+            self.cur.callproc('send_validated_data', [source_code])
         logger.debug("Moving data to epidemiology")
 
-    def truncate_staging(self):
+    def truncate_staging(self, source_code: str = None):
         # TODO: Add more staging tables, currently only for epidemiology
-        sql_query = sql.SQL("""TRUNCATE staging_epidemiology; SELECT 1""")
-        self.execute(sql_query)
+        if not source_code:
+            sql_query = sql.SQL("""TRUNCATE staging_epidemiology; SELECT 1""")
+            self.execute(sql_query)
+            return
+
+        # Each source stages into its own list partition, so truncating it leaves other sources untouched
+        sql_query = sql.SQL("""
+            CREATE TABLE IF NOT EXISTS covid19_schema.{partition}
+                PARTITION OF covid19_schema.staging_epidemiology FOR VALUES IN (%s);
+            TRUNCATE covid19_schema.{partition};
+            SELECT 1""").format(
+            partition=sql.Identifier(partition_name('staging_epidemiology', source_code))
+        )
+        self.execute(sql_query, (source_code,))
+
+    def reset_adm_division_cache(self):
+        # Administrative divisions by countrycode and normalized areas, loaded once per job and country
+        super().reset_adm_division_cache()
+        self.adm_divisions = dict()
+        self.adm_division_cache = dict()
+
+    def load_adm_divisions(self, countrycode: str) -> Dict:
+        if countrycode not in self.adm_divisions:
+            sql_query = sql.SQL("""
+                SELECT country, adm_area_1, adm_area_2, adm_area_3, gid from covid19_schema.administrative_division
+                WHERE countrycode = %s""")
+            index = dict()
+            for row in self.execute(sql_query, (countrycode,)):
+                key = (normalize_adm_area(row['adm_area_1']), normalize_adm_area(row['adm_area_2']),
+                       normalize_adm_area(row['adm_area_3']))
+                index.setdefault(key, []).append(
+                    (row['country'], row['adm_area_1'], row['adm_area_2'], row['adm_area_3'], [row['gid']]))
+            self.adm_divisions[countrycode] = index
+            logger.debug(f'Loaded {len(index)} administrative divisions for {countrycode}')
+        return self.adm_divisions[countrycode]
+
+    def tracks_revisions(self, table_name: str) -> bool:
+        # Staging tables are truncated before every run, all their rows are inserted
+        return not table_name.startswith('staging_')
+
+    def get_adm_divisions(self, countrycode: str) -> List[Tuple]:
+        return [division for divisions in self.load_adm_divisions(countrycode).values() for division in divisions]
 
     def get_adm_division(self, countrycode: str, adm_area_1: str = None, adm_area_2: str = None,
                          adm_area_3: str = None) -> Tuple:
+        key = (countrycode, adm_area_1, adm_area_2, adm_area_3)
+        if key not in self.adm_division_cache:
+            areas = tuple(normalize_adm_area(area) for area in (adm_area_1, adm_area_2, adm_area_3))
+            if any('%' in area or '_' in area for area in areas):
+                # Patterns are matched by the database
+                results = self.query_adm_division(countrycode, adm_area_1, adm_area_2, adm_area_3)
+            else:
+                results = self.load_adm_divisions(countrycode).get(areas, [])
+            self.adm_division_cache[key] = results
+
+        results = self.adm_division_cache[key]
+        if not results:
+            raise Exception(f'Unable to find adm division for: {countrycode}, {adm_area_1}, {adm_area_2}, {adm_area_3}')
+        if len(results) > 1:
+            raise Exception(f'Ambiguous result: {results}')
+        return results[0]
+
+    def query_adm_division(self, countrycode: str, adm_area_1: str = None, adm_area_2: str = None,
+                           adm_area_3: str = None) -> List[Tuple]:
         sql_query = sql.SQL("""
             SELECT country, adm_area_1, adm_area_2, adm_area_3, gid from covid19_schema.administrative_division
             WHERE countrycode = %s
@@ -120,110 +226,127 @@ class PostgresqlHelper(AbstractAdapter):
                     ILIKE regexp_replace(%s, '[^\w%%]+','','g') """)
 
         results = self.execute(sql_query, (countrycode, adm_area_1 or '', adm_area_2 or '', adm_area_3 or ''))
-        if not results:
-            raise Exception(f'Unable to find adm division for: {countrycode}, {adm_area_1}, {adm_area_2}, {adm_area_3}')
-        if len(results) > 1:
-            raise Exception(f'Ambiguous result: {results}')
-        result = results[0]
-        return result['country'], result['adm_area_1'], result['adm_area_2'], result['adm_area_3'], [result['gid']]
+        return [(result['country'], result['adm_area_1'], result['adm_area_2'], result['adm_area_3'], [result['gid']])
+                for result in results]
 
     def upsert_table_data(self, table_name: str, data_keys: List, **kwargs):
         self.check_if_gid_exists(kwargs)
-        target = ["date", "country", "countrycode", "COALESCE(adm_area_1, '')", "COALESCE(adm_area_2, '')",
-                  "COALESCE(adm_area_3, '')", "source"]
+        target = conflict_target(table_name)
+
+        if self.schema:
+            self.schema.ensure_partition(table_name, kwargs.get('source'), kwargs.get('date'))
 
-        if 'msoa' in data_keys:
-            target.append('msoa')
+        update_keys = [k for k in kwargs.keys() if k in data_keys]
 
         sql_query = sql.SQL("""INSERT INTO covid19_schema.{table_name} ({insert_keys}) VALUES ({insert_data})
                                 ON CONFLICT
                                     (""" + ",".join(target) + """)
                                 DO
                                     UPDATE SET {update_data}
-                                RETURNING *""").format(
+                                    WHERE {values_changed}
+                                RETURNING xmax <> 0 AS revised""").format(
             table_name=sql.Identifier(table_name),
             insert_keys=sql.SQL(",").join(map(sql.Identifier, kwargs.keys())),
             insert_data=sql.SQL(",").join(map(sql.Placeholder, kwargs.keys())),
             update_data=sql.SQL(",").join(
-                sql.Composed([sql.Identifier(k), sql.SQL("="), sql.Placeholder(k)]) for k in kwargs.keys() if
-                k in data_keys)
+                sql.Composed([sql.Identifier(k), sql.SQL("="), sql.Placeholder(k)]) for k in update_keys),
+            values_changed=values_changed(table_name, update_keys)
         )
 
-        self.execute(sql_query, kwargs)
+        result = self.execute(sql_query, kwargs)
+        self.count_upsert(changed=bool(result))
+        # xmax is set when an existing row was updated rather than a new one inserted
+        if result and result[0]['revised']:
+            self.count_revision(kwargs.get('source'), kwargs.get('date'))
         logger.debug("Updating {} table with data: {}".format(table_name, list(kwargs.values())))
 
     def upsert_government_response_data(self, table_name: str = 'government_response', **kwargs):
-        government_response_data_fields = [
-            'c1_school_closing', 'c1_flag',
-            'c2_workplace_closing', 'c2_flag',
-            'c3_cancel_public_events', 'c3_flag',
-            'c4_restrictions_on_gatherings', 'c4_flag',
-            'c5_close_public_transport', 'c5_flag',
-            'c6_stay_at_home_requirements', 'c6_flag',
-            'c7_restrictions_on_internal_movement', 'c7_flag',
-            'c8_international_travel_controls',
-            'e1_income_support', 'e1_flag',
-            'e2_debtcontract_relief',
-            'e3_fiscal_measures',
-            'e4_international_support',
-            'h1_public_information_campaigns', 'h1_flag',
-            'h2_testing_policy',
-            'h3_contact_tracing',
-            'h4_emergency_investment_in_healthcare',
-            'h5_investment_in_vaccines',
-            'm1_wildcard',
-            'stringency_index',
-            'stringency_indexfordisplay',
-            'stringency_legacy_index',
-            'stringency_legacy_indexfordisplay',
-            'government_response_index',
-            'government_response_index_for_display',
-            'containment_health_index',
-            'containment_health_index_for_display',
-            'economic_support_index',
-            'economic_support_index_for_display',
-            'actions'
-        ]
-        self.upsert_table_data(table_name, government_response_data_fields, **kwargs)
+        self.upsert_table_data(table_name, get_schema(table_name).data_keys, **kwargs)
 
     def upsert_epidemiology_data(self, table_name: str = 'epidemiology', data_keys: list = None, **kwargs):
-        if not data_keys:
-            data_keys = ['gid', 'tested', 'confirmed', 'quarantined', 'hospitalised', 'hospitalised_icu', 'dead',
-                         'recovered']
-        self.upsert_table_data(table_name, data_keys, **kwargs)
+        self.upsert_table_data(table_name, data_keys or get_schema(table_name).data_keys, **kwargs)
 
     def upsert_mobility_data(self, table_name: str = 'mobility', **kwargs):
-        data_keys = ['gid', 'transit_stations', 'residential', 'workplace', 'parks', 'retail_recreation',
-                     'grocery_pharmacy']
-
-        self.upsert_table_data(table_name, data_keys, **kwargs)
+        self.upsert_table_data(table_name, get_schema(table_name).data_keys, **kwargs)
 
     def upsert_weather_data(self, table_name: str = 'weather', **kwargs):
-        composite_key = ['date', 'countrycode', 'gid']
-
         self.check_if_gid_exists(kwargs)
+        data_keys = get_schema(table_name).data_keys
+        update_keys = [k for k in kwargs.keys() if k in data_keys]
+
         sql_query = sql.SQL("""INSERT INTO {table_name} ({insert_keys}) VALUES ({insert_data})
                                 ON CONFLICT
                                     (date, gid)
                                 DO
                                     UPDATE SET {update_data}
-                               RETURNING *
+                                    WHERE {values_changed}
+                               RETURNING xmax <> 0 AS revised
                                     """).format(
             table_name=sql.Identifier(table_name),
             insert_keys=sql.SQL(",").join(map(sql.Identifier, kwargs.keys())),
             insert_data=sql.SQL(",").join(map(sql.Placeholder, kwargs.keys())),
             update_data=sql.SQL(",").join(
-                sql.Composed([sql.Identifier(k), sql.SQL("="), sql.Placeholder(k)]) for k in kwargs.keys() if
-                k not in composite_key)
+                sql.Composed([sql.Identifier(k), sql.SQL("="), sql.Placeholder(k)]) for k in update_keys),
+            values_changed=values_changed(table_name, update_keys)
         )
 
-        self.execute(sql_query, kwargs)
+        result = self.execute(sql_query, kwargs)
+        self.count_upsert(changed=bool(result))
+        # xmax is set when an existing row was updated rather than a new one inserted
+        if result and result[0]['revised']:
+            self.count_revision(kwargs.get('source'), kwargs.get('date'))
         logger.debug(
             "Updating {} table with data: {}".format(table_name, list(kwargs.values())))
 
+    def write_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        table_name = self.correct_table_name(fetcher_type.value)
+        schema = get_schema(table_name)
+
+        # A statement can't update the same row twice, the last row of a key wins as with single upserts
+        key_columns = [column for column in schema.key if column in df.columns]
+        df = df[~df[key_columns].astype(str).duplicated(keep='last')]
+
+        if self.schema:
+            for source, date_value in df[['source', 'date']].drop_duplicates().itertuples(index=False):
+                self.schema.ensure_partition(table_name, source, date_value)
+
+        columns = list(df.columns)
+        update_keys = [column for column in columns if column in schema.data_keys]
+        if update_keys:
+            conflict_action = sql.SQL("UPDATE SET {update_data} WHERE {values_changed}").format(
+                update_data=sql.SQL(",").join(
+                    sql.SQL("{column}=EXCLUDED.{column}").format(column=sql.Identifier(k)) for k in update_keys),
+                values_changed=values_changed(table_name, update_keys))
+        else:
+            conflict_action = sql.SQL("NOTHING")
+
+        # Weather lives outside of covid19_schema, as in upsert_weather_data()
+        table = sql.Identifier(table_name) if table_name == 'weather' else sql.Identifier('covid19_schema', table_name)
+        sql_query = sql.SQL("""INSERT INTO {table} AS {table_alias} ({insert_keys}) VALUES %s
+                                ON CONFLICT
+                                    (""" + ",".join(conflict_target(table_name)) + """)
+                                DO
+                                    {conflict_action}
+                                RETURNING source, date, xmax <> 0""").format(
+            table=table,
+            table_alias=sql.Identifier(table_name),
+            insert_keys=sql.SQL(",").join(map(sql.Identifier, columns)),
+            conflict_action=conflict_action
+        )
+
+        rows = [tuple(row.values()) for row in self.frame_records(df)]
+        with self.lock:
+            result = psycopg2.extras.execute_values(self.cur, sql_query, rows, page_size=1000, fetch=True)
+            self.conn.commit()
+        self.count_upsert(changed=True, count=len(result))
+        self.count_upsert(changed=False, count=len(rows) - len(result))
+        for source, revised_date, revised in result:
+            if revised:
+                self.count_revision(source, revised_date)
+        logger.debug(f"Upserted {len(rows)} rows into {table_name}")
+
     def upsert_diagnostics(self, **kwargs):
-        data_keys = ["validation_success", "error", "last_run_start", "last_run_stop", "first_timestamp",
-                     "last_timestamp", "details"]
+        data_keys = get_schema('diagnostics').data_keys
         sql_query = sql.SQL("""INSERT INTO covid19_schema.diagnostics ({insert_keys}) VALUES ({insert_data})
                                         ON CONFLICT
                                             (table_name, source)
@@ -246,7 +369,25 @@ class PostgresqlHelper(AbstractAdapter):
         result = self.execute(sql_query, (source, date, gid))
         return result[0] if len(result) == 1 else None
 
+    def watermarks_available(self) -> bool:
+        result = self.execute("SELECT to_regclass('covid19_schema.source_watermark') IS NOT NULL AS exists")
+        return result[0]['exists']
+
+    def get_watermarks(self, table_name: str, source: str = None) -> List:
+        sql_str = """SELECT country, min(min_date) as min_date, max(max_date) as max_date, sum(row_count) as row_count
+                     FROM covid19_schema.source_watermark WHERE table_name = %s"""
+        params = (table_name,)
+        if source:
+            sql_str = sql_str + """ AND source = %s"""
+            params = params + (source,)
+        sql_str = sql_str + " GROUP BY country"
+
+        return self.execute(sql.SQL(sql_str), params)
+
     def get_earliest_timestamp(self, table_name: str, source: str = None):
+        if self.use_watermarks:
+            return min((row['min_date'] for row in self.get_watermarks(table_name, source)), default=None)
+
         sql_str = """SELECT min(date) as date FROM covid19_schema.{table_name}"""
         if source:
             sql_str = sql_str + """ WHERE source = %s"""
@@ -257,6 +398,9 @@ class PostgresqlHelper(AbstractAdapter):
         return result[0]['date'] if len(result) > 0 else None
 
     def get_latest_timestamp(self, table_name: str, source: str = None):
+        if self.use_watermarks:
+            return max((row['max_date'] for row in self.get_watermarks(table_name, source)), default=None)
+
         sql_str = """SELECT max(date) as date FROM covid19_schema.{table_name}"""
         if source:
             sql_str = sql_str + """ WHERE source = %s"""
@@ -267,15 +411,18 @@ class PostgresqlHelper(AbstractAdapter):
         return result[0]['date'] if len(result) > 0 else None
 
     def get_details(self, table_name: str, source: str = None):
-        sql_str = """SELECT country, min(date) as min_date, max(date) as max_date  
-                     FROM covid19_schema.{table_name}"""
-        if source:
-            sql_str = sql_str + """ WHERE source = %s"""
-        sql_str = sql_str + " GROUP BY country"
-
-        sql_query = sql.SQL(sql_str).format(table_name=sql.Identifier(table_name))
-
-        result = self.execute(sql_query, (source,))
+        if self.use_watermarks:
+            result = self.get_watermarks(table_name, source)
+        else:
+            sql_str = """SELECT country, min(date) as min_date, max(date) as max_date  
+                         FROM covid19_schema.{table_name}"""
+            if source:
+                sql_str = sql_str + """ WHERE source = %s"""
+            sql_str = sql_str + " GROUP BY country"
+
+            sql_query = sql.SQL(sql_str).format(table_name=sql.Identifier(table_name))
+
+            result = self.execute(sql_query, (source,))
         result_list = []
         columns = ['country', 'min_date', 'max_date']
         for row in result:
@@ -0,0 +1,193 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import logging
+from datetime import date, datetime
+from typing import List
+from psycopg2 import sql
+
+from utils.schema import get_schema
+
+__all__ = ('PostgresqlSchemaManager', 'conflict_target', 'partition_name')
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = 'covid19_schema'
+
+# Tables whose conflict indexes are checked by migrate()
+MANAGED_TABLES = ['epidemiology', 'staging_epidemiology', 'epidemiology_england_msoa', 'mobility',
+                  'government_response', 'weather']
+
+# Weather is not listed: its conflict target (date, gid) does not contain the partition key
+PARTITIONED_TABLES = ['epidemiology', 'epidemiology_england_msoa', 'mobility', 'government_response']
+
+
+def conflict_target(table_name: str) -> List[str]:
+    # Nullable key columns are indexed through COALESCE, NULL never conflicts with NULL
+    schema = get_schema(table_name)
+    return [column if column in schema.not_null else f"COALESCE({column}, '')" for column in schema.key]
+
+
+def partition_name(table_name: str, source: str) -> str:
+    return table_name + '_' + re.sub(r'[^a-z0-9_]', '_', source.lower())
+
+
+def normalize_index_column(column: str) -> str:
+    # pg_get_indexdef() adds casts and spacing, e.g. "COALESCE(adm_area_1, ''::text)"
+    return re.sub(r"::[a-z ]+|\s|[()]", '', column.lower())
+
+
+def date_year(value) -> int:
+    if isinstance(value, str):
+        return int(value[:4])
+    if isinstance(value, (date, datetime)):
+        return value.year
+    return None
+
+
+class PostgresqlSchemaManager:
+    def __init__(self, db, partition_by_date: bool = False):
+        self.db = db
+        self.partition_by_date = partition_by_date
+        self.partitions = dict()
+
+    def table_exists(self, table_name: str) -> bool:
+        result = self.db.execute("SELECT to_regclass(%s) IS NOT NULL AS exists", (f'{SCHEMA}.{table_name}',))
+        return result[0]['exists']
+
+    def is_partitioned(self, table_name: str) -> bool:
+        sql_query = """SELECT c.relkind = 'p' AS partitioned FROM pg_class c
+                       JOIN pg_namespace n ON n.oid = c.relnamespace
+                       WHERE n.nspname = %s AND c.relname = %s"""
+        result = self.db.execute(sql_query, (SCHEMA, table_name))
+        return bool(result) and result[0]['partitioned']
+
+    def unique_indexes(self, table_name: str) -> List[List[str]]:
+        sql_query = """SELECT array(SELECT pg_get_indexdef(i.indexrelid, k, true)
+                                    FROM generate_series(1, i.indnatts) AS k) AS columns
+                       FROM pg_index i
+                       JOIN pg_class c ON c.oid = i.indrelid
+                       JOIN pg_namespace n ON n.oid = c.relnamespace
+                       WHERE i.indisunique AND n.nspname = %s AND c.relname = %s"""
+        return [row['columns'] for row in self.db.execute(sql_query, (SCHEMA, table_name))]
+
+    def ensure_indexes(self, table_name: str):
+        target = conflict_target(table_name)
+        expected = set(map(normalize_index_column, target))
+        if not any(set(map(normalize_index_column, columns)) == expected
+                   for columns in self.unique_indexes(table_name)):
+            logger.warning(f"Creating missing conflict index on {table_name}: {target}")
+            self.db.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} (" + ",".join(target) +
+                                    "); SELECT 1").format(
+                index=sql.Identifier(table_name + '_conflict_idx'),
+                table=sql.Identifier(SCHEMA, table_name)))
+
+        # Serves min/max(date) lookups and validation per source
+        self.db.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} (source, date); SELECT 1").format(
+            index=sql.Identifier(table_name + '_source_date_idx'),
+            table=sql.Identifier(SCHEMA, table_name)))
+
+    def migrate(self):
+        for table_name in MANAGED_TABLES:
+            if not self.table_exists(table_name):
+                logger.error(f"Table {SCHEMA}.{table_name} doesn't exist")
+                continue
+            if table_name in PARTITIONED_TABLES and not self.is_partitioned(table_name):
+                self.migrate_to_partitioned(table_name)
+            self.ensure_indexes(table_name)
+
+    def migrate_to_partitioned(self, table_name: str):
+        logger.info(f"Migrating {SCHEMA}.{table_name} to a table partitioned by source")
+        legacy_table = table_name + '_unpartitioned'
+        statements = [
+            sql.SQL("ALTER TABLE {table} RENAME TO {legacy}").format(
+                table=sql.Identifier(SCHEMA, table_name), legacy=sql.Identifier(legacy_table)),
+            sql.SQL("CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                    "PARTITION BY LIST (source)").format(
+                table=sql.Identifier(SCHEMA, table_name), legacy=sql.Identifier(SCHEMA, legacy_table))
+        ]
+
+        sql_query = sql.SQL("SELECT source, array_agg(DISTINCT date_part('year', date)::int) AS years "
+                            "FROM {table} GROUP BY source").format(table=sql.Identifier(SCHEMA, table_name))
+        for row in self.db.execute(sql_query):
+            statements.extend(self.create_partition_statements(table_name, row['source'], row['years']))
+
+        statements.append(sql.SQL("INSERT INTO {table} SELECT * FROM {legacy}").format(
+            table=sql.Identifier(SCHEMA, table_name), legacy=sql.Identifier(SCHEMA, legacy_table)))
+        if self.has_watermark_trigger(table_name):
+            # Created after the copy, the rows already counted by the watermarks aren't counted again
+            statements.extend(self.move_watermark_trigger_statements(table_name, legacy_table))
+        statements.append(sql.SQL("SELECT 1"))
+
+        # A multi-statement query runs as a single transaction
+        self.db.execute(sql.SQL("; ").join(statements))
+        logger.warning(f"{SCHEMA}.{table_name} migrated, previous data kept in {SCHEMA}.{legacy_table}")
+
+    def has_watermark_trigger(self, table_name: str) -> bool:
+        # The trigger of sql/source_watermark.sql, it stays with the table when it is renamed
+        sql_query = sql.SQL("SELECT count(*) AS count FROM pg_trigger WHERE tgname = %s AND tgrelid = to_regclass(%s)")
+        result = self.db.execute(sql_query, (f'{table_name}_watermark', f'{SCHEMA}.{table_name}'))
+        return bool(result and result[0]['count'])
+
+    @staticmethod
+    def move_watermark_trigger_statements(table_name: str, legacy_table: str) -> List:
+        trigger = sql.Identifier(f'{table_name}_watermark')
+        return [
+            sql.SQL("DROP TRIGGER {trigger} ON {legacy}").format(
+                trigger=trigger, legacy=sql.Identifier(SCHEMA, legacy_table)),
+            sql.SQL("CREATE TRIGGER {trigger} AFTER INSERT ON {table} FOR EACH ROW "
+                    "EXECUTE PROCEDURE {function}({table_name})").format(
+                trigger=trigger, table=sql.Identifier(SCHEMA, table_name),
+                function=sql.Identifier(SCHEMA, 'update_source_watermark'), table_name=sql.Literal(table_name))
+        ]
+
+    def create_partition_statements(self, table_name: str, source: str, years: List[int] = None) -> List:
+        partition = partition_name(table_name, source)
+        statements = [sql.SQL("CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES IN ({source})"
+                              + (" PARTITION BY RANGE (date)" if self.partition_by_date else "")).format(
+            partition=sql.Identifier(SCHEMA, partition),
+            table=sql.Identifier(SCHEMA, table_name),
+            source=sql.Literal(source))]
+        if self.partition_by_date:
+            statements.extend(self.create_date_partition_statement(partition, year) for year in years or [])
+        return statements
+
+    @staticmethod
+    def create_date_partition_statement(partition: str, year: int):
+        return sql.SQL("CREATE TABLE IF NOT EXISTS {date_partition} PARTITION OF {partition} "
+                       "FOR VALUES FROM ({date_from}) TO ({date_to})").format(
+            date_partition=sql.Identifier(SCHEMA, f'{partition}_{year}'),
+            partition=sql.Identifier(SCHEMA, partition),
+            date_from=sql.Literal(f'{year}-01-01'),
+            date_to=sql.Literal(f'{year + 1}-01-01'))
+
+    def ensure_partition(self, table_name: str, source: str, date_value=None):
+        if table_name not in PARTITIONED_TABLES or not source:
+            return
+
+        key = (table_name, source)
+        if key not in self.partitions:
+            statements = self.create_partition_statements(table_name, source)
+            self.db.execute(sql.SQL("; ").join(statements + [sql.SQL("SELECT 1")]))
+            # Existing partitions keep the layout they were created with
+            self.partitions[key] = {'by_date': self.is_partitioned(partition_name(table_name, source)),
+                                    'years': set()}
+
+        partition_info = self.partitions[key]
+        year = date_year(date_value)
+        if partition_info['by_date'] and year and year not in partition_info['years']:
+            statement = self.create_date_partition_statement(partition_name(table_name, source), year)
+            self.db.execute(sql.SQL("; ").join([statement, sql.SQL("SELECT 1")]))
+            partition_info['years'].add(year)
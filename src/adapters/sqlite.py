@@ -12,189 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import logging
 import sqlite3
-from typing import Dict
+import threading
+from typing import Dict, List, Tuple
+from itertools import groupby
+from operator import itemgetter
 import pandas as pd
 
 __all__ = ('SqliteHelper',)
 
+from utils.types import FetcherType
 from utils.adapter.abstract_adapter import AbstractAdapter
+from utils.adapter.background_writer import BackgroundWriter
+from utils.schema import SCHEMAS
 
 logger = logging.getLogger(__name__)
 
-sql_create_epidemiology_table = """
-    CREATE TABLE IF NOT EXISTS epidemiology (
-        source text NOT NULL,
-        date date NOT NULL,
-        country text NOT NULL,
-        countrycode text NOT NULL,
-        adm_area_1 text DEFAULT NULL,
-        adm_area_2 text DEFAULT NULL,
-        adm_area_3 text DEFAULT NULL,
-        gid text DEFAULT NULL,
-        tested integer DEFAULT NULL,
-        confirmed integer DEFAULT NULL,
-        recovered integer DEFAULT NULL,
-        dead integer DEFAULT NULL,
-        hospitalised integer DEFAULT NULL,
-        hospitalised_icu integer DEFAULT NULL,
-        quarantined integer DEFAULT NULL,
-        UNIQUE (source, date, country, countrycode, adm_area_1, adm_area_2, adm_area_3) ON CONFLICT REPLACE,
-        PRIMARY KEY (source, date, country, countrycode, adm_area_1, adm_area_2, adm_area_3)
-    ) WITHOUT ROWID"""
-
-sql_create_government_response_table = """
-    CREATE TABLE IF NOT EXISTS government_response (
-        source text NOT NULL,
-        date date NOT NULL,
-        country text NOT NULL,
-        countrycode text NOT NULL,
-        adm_area_1 text DEFAULT NULL,
-        adm_area_2 text DEFAULT NULL,
-        adm_area_3 text DEFAULT NULL,
-        gid text DEFAULT NULL,
-        c1_school_closing integer DEFAULT NULL,
-        c1_flag integer DEFAULT NULL,
-        c2_workplace_closing integer DEFAULT NULL,
-        c2_flag integer DEFAULT NULL,
-        c3_cancel_public_events integer DEFAULT NULL,
-        c3_flag integer DEFAULT NULL,
-        c4_restrictions_on_gatherings integer DEFAULT NULL,
-        c4_flag integer DEFAULT NULL,
-        c5_close_public_transport integer DEFAULT NULL,
-        c5_flag integer DEFAULT NULL,
-        c6_stay_at_home_requirements integer DEFAULT NULL,
-        c6_flag integer DEFAULT NULL,
-        c7_restrictions_on_internal_movement integer DEFAULT NULL,
-        c7_flag integer DEFAULT NULL,
-        c8_international_travel_controls integer DEFAULT NULL,
-        e1_income_support integer DEFAULT NULL,
-        e1_flag integer DEFAULT NULL,
-        e2_debtcontract_relief integer DEFAULT NULL,
-        e3_fiscal_measures float DEFAULT NULL,
-        e4_international_support float DEFAULT NULL,
-        h1_public_information_campaigns integer DEFAULT NULL,
-        h1_flag integer DEFAULT NULL,
-        h2_testing_policy integer DEFAULT NULL,
-        h3_contact_tracing integer DEFAULT NULL,
-        h4_emergency_investment_in_healthcare float DEFAULT NULL,
-        h5_investment_in_vaccines float DEFAULT NULL,
-        m1_wildcard text DEFAULT NULL,
-        stringency_index float DEFAULT NULL,
-        stringency_indexfordisplay float DEFAULT NULL,
-        stringency_legacy_index float DEFAULT NULL,
-        stringency_legacy_indexfordisplay float DEFAULT NULL,
-        government_response_index float DEFAULT NULL,
-        government_response_index_for_display float DEFAULT NULL,
-        containment_health_index float DEFAULT NULL,
-        containment_health_index_for_display float DEFAULT NULL,
-        economic_support_index float DEFAULT NULL,
-        economic_support_index_for_display float DEFAULT NULL,
-        actions json DEFAULT NULL,
-        UNIQUE (source, date, country, countrycode, adm_area_1, adm_area_2, adm_area_3) ON CONFLICT REPLACE,
-        PRIMARY KEY (source, date, country, countrycode, adm_area_1, adm_area_2, adm_area_3)
-    ) WITHOUT ROWID"""
-
-sql_create_mobility_table = """
-    CREATE TABLE IF NOT EXISTS government_response (
-        source text NOT NULL,
-        date date NOT NULL,
-        country text NOT NULL,
-        countrycode text NOT NULL,
-        adm_area_1 text DEFAULT NULL,
-        adm_area_2 text DEFAULT NULL,
-        adm_area_3 text DEFAULT NULL,
-        gid text DEFAULT NULL,
-        transit_stations integer DEFAULT NULL,
-        residential integer DEFAULT NULL,
-        workplace  integer DEFAULT NULL,
-        parks  integer DEFAULT NULL,
-        retail_recreation integer DEFAULT NULL,
-        grocery_pharmacy integer DEFAULT NULL,
-        transit integer DEFAULT NULL,
-        walking integer DEFAULT NULL,
-        driving integer DEFAULT NULL,
-        UNIQUE (source, date, country, countrycode, adm_area_1, adm_area_2, adm_area_3) ON CONFLICT REPLACE,
-        PRIMARY KEY (source, date, country, countrycode, adm_area_1, adm_area_2, adm_area_3)
-    ) WITHOUT ROWID"""
-
-sql_create_weather_table = """
-    CREATE TABLE IF NOT EXISTS weather (
-        source text NOT NULL,
-        date date NOT NULL,
-        gid text NOT NULL,
-        country text NOT NULL,
-        countrycode text NOT NULL,
-        adm_area_1 text,
-        adm_area_2 text,
-        adm_area_3 text,
-        samplesize int,
-        precipitation_max_avg float,
-        precipitation_max_std float,
-        precipitation_mean_avg float,
-        precipitation_mean_std float,
-        humidity_max_avg float,
-        humidity_max_std float,
-        humidity_mean_avg float,
-        humidity_mean_std float,
-        humidity_min_avg float,
-        humidity_min_std float,
-        sunshine_max_avg float,
-        sunshine_max_std float,
-        sunshine_mean_avg float,
-        sunshine_mean_std float,
-        temperature_max_avg float,
-        temperature_max_std float,
-        temperature_mean_avg float,
-        temperature_mean_std float,
-        temperature_min_avg float,
-        temperature_min_std float,
-        windgust_max_avg float,
-        windgust_max_std float,
-        windgust_mean_avg float,
-        windgust_mean_std float,
-        windgust_min_avg float,
-        windgust_min_std float,
-        windspeed_max_avg float,
-        windspeed_max_std float,
-        windspeed_mean_avg float,
-        windspeed_mean_std float,
-        windspeed_min_avg float,
-        windspeed_min_std float,
-        cloudaltitude_max_valid float,
-        cloudaltitude_max_avg float,
-        cloudaltitude_max_std float,
-        cloudaltitude_min_valid float,
-        cloudaltitude_min_avg float,
-        cloudaltitude_min_std float,
-        cloudaltitude_mean_valid float,
-        cloudaltitude_mean_avg float,
-        cloudaltitude_mean_std float,
-        cloudfrac_max_avg float,
-        cloudfrac_max_std float,
-        cloudfrac_min_avg float,
-        cloudfrac_min_std float,
-        cloudfrac_mean_avg float,
-        cloudfrac_mean_std float,
-        UNIQUE (gid, date),
-        PRIMARY KEY (gid, date)
-    ) WITHOUT ROWID"""
-
-sql_create_diagnostics_table = """
-    CREATE TABLE IF NOT EXISTS diagnostics (
-        table_name text NOT NULL,
-        source text NOT NULL,
-        validation_success text,
-        error text,
-        last_run_start date, 
-        last_run_stop date, 
-        first_timestamp date, 
-        last_timestamp date,
-        UNIQUE (table_name, source),
-        PRIMARY KEY (table_name, source)
-    ) WITHOUT ROWID"""
-
 
 def update_type(val):
     if isinstance(val, pd.Timestamp):
@@ -202,45 +37,142 @@ def update_type(val):
     return val
 
 
+def set_bulk_pragmas(conn: sqlite3.Connection):
+    # WAL with synchronous=NORMAL fsyncs on checkpoints only, not on every commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+class SqliteWriter:
+    """
+    Owns the only writing connection to a SQLite file. Every SqliteHelper in single writer mode hands its
+    rows to the writer of its file through a bounded queue. The rows of each producer in a batch are committed
+    in a transaction of their own, a failing row only rolls back the rows of its producer and the error is
+    raised to that producer on its next put() or join().
+    """
+    WRITERS = dict()
+    WRITERS_LOCK = threading.Lock()
+
+    @classmethod
+    def get_writer(cls, sqlite_file_path: str, queue_size: int, batch_size: int) -> 'SqliteWriter':
+        key = os.path.abspath(sqlite_file_path)
+        with cls.WRITERS_LOCK:
+            if key not in cls.WRITERS:
+                cls.WRITERS[key] = cls(sqlite_file_path, queue_size, batch_size)
+            return cls.WRITERS[key]
+
+    def __init__(self, sqlite_file_path: str, queue_size: int, batch_size: int):
+        self.sqlite_file_path = sqlite_file_path
+        self.conn = None
+        self.errors = dict()
+        self.errors_lock = threading.Lock()
+        self.writer = BackgroundWriter(self.write_batch, maxsize=queue_size, batch_size=batch_size,
+                                       name=f'sqlite-writer-{os.path.basename(sqlite_file_path)}')
+
+    def put(self, producer, sql_query: str, values: List):
+        self.raise_error(producer)
+        self.writer.put((producer, sql_query, values))
+
+    def join(self, producer):
+        self.writer.join()
+        self.raise_error(producer)
+
+    def raise_error(self, producer):
+        with self.errors_lock:
+            error = self.errors.pop(producer, None)
+        if error:
+            raise error
+
+    def write_batch(self, batch: List[Tuple[object, str, List]]):
+        # The connection is opened lazily so that it belongs to the writer thread
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.sqlite_file_path)
+            set_bulk_pragmas(self.conn)
+
+        producer_rows = dict()
+        for producer, sql_query, values in batch:
+            producer_rows.setdefault(producer, []).append((sql_query, values))
+
+        for producer, rows in producer_rows.items():
+            try:
+                with self.conn:
+                    for sql_query, query_rows in groupby(rows, key=itemgetter(0)):
+                        self.conn.executemany(sql_query, [values for _, values in query_rows])
+            except Exception as ex:
+                logger.error(f'Unable to write {len(rows)} rows to {self.sqlite_file_path}: {ex}')
+                with self.errors_lock:
+                    self.errors.setdefault(producer, ex)
+
+
 class SqliteHelper(AbstractAdapter):
-    def __init__(self, sqlite_file_path: str):
+    thread_safe_reads = True
+
+    def __init__(self, sqlite_file_path: str, bulk: bool = False, batch_size: int = 5000,
+                 single_writer: bool = False, queue_size: int = 10000):
         self.sqlite_file_path = sqlite_file_path
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.single_writer = single_writer
+        self.insert_queries = dict()
+        self.buffer = []
 
         self.conn = None
         self.cur = None
+        self.error = None
+        # Serializes the cursor between the fetcher and the fan-out or write-behind threads
+        self.lock = threading.RLock()
         self.open_connection()
         self.cursor()
         self.create_tables()
 
+        self.writer = None
+        if self.single_writer:
+            self.writer = SqliteWriter.get_writer(sqlite_file_path, queue_size, batch_size)
+
+    def fingerprint_target(self) -> str:
+        return f'sqlite:{os.path.abspath(self.sqlite_file_path)}'
+
     def open_connection(self):
         self.conn = None
         try:
-            self.conn = sqlite3.connect(self.sqlite_file_path)
+            self.conn = sqlite3.connect(self.sqlite_file_path, check_same_thread=False)
+            if self.bulk or self.single_writer:
+                set_bulk_pragmas(self.conn)
         except Exception as e:
             print(e)
 
     def create_tables(self):
-        self.execute(sql_create_epidemiology_table)
-        self.execute(sql_create_government_response_table)
-        self.execute(sql_create_mobility_table)
-        self.execute(sql_create_weather_table)
-        self.execute(sql_create_diagnostics_table)
+        for schema in SCHEMAS.values():
+            self.execute(schema.sqlite_ddl())
 
     def cursor(self):
         self.cur = self.conn.cursor()
         return self.cur
 
     def execute(self, query: str, data: str = None):
-        try:
-            if data:
-                self.cur.execute(query, data)
-            else:
-                self.cur.execute(query)
-            self.conn.commit()
-        except Exception as ex:
-            print(ex)
-
-        return self.cur.fetchall()
+        with self.lock:
+            try:
+                if data:
+                    self.cur.execute(query, data)
+                else:
+                    self.cur.execute(query)
+                if not self.bulk:
+                    self.conn.commit()
+            except Exception as ex:
+                print(ex)
+                self.error = self.error or ex
+
+            return self.cur.fetchall()
+
+    def execute_many(self, query: str, data: List):
+        with self.lock:
+            try:
+                self.cur.executemany(query, data)
+            except Exception as ex:
+                print(ex)
+                self.error = self.error or ex
 
     def format_data(self, data: Dict):
         # Add adm_area values if don't exist
@@ -256,17 +188,75 @@ class SqliteHelper(AbstractAdapter):
         # TODO: Implement get division
         raise NotImplementedError("To be implemented")
 
+    def get_insert_query(self, table_name: str, keys: Tuple) -> str:
+        query_key = (table_name, keys)
+        if query_key not in self.insert_queries:
+            self.insert_queries[query_key] = """INSERT OR REPLACE INTO {table_name} ({insert_keys}) VALUES ({insert_data})""".format(
+                table_name=table_name,
+                insert_keys=",".join(keys),
+                insert_data=",".join('?' * len(keys)),
+            )
+        return self.insert_queries[query_key]
+
     def upsert_table_data(self, table_name: str, **kwargs):
         self.check_if_gid_exists(kwargs)
         kwargs = self.format_data(kwargs)
-        sql_query = """INSERT OR REPLACE INTO covid19_schema.{table_name} ({insert_keys}) VALUES ({insert_data})""".format(
-            table_name=table_name,
-            insert_keys=",".join([key for key in kwargs.keys()]),
-            insert_data=",".join('?' * len(kwargs)),
-        )
-        self.execute(sql_query, [update_type(val) for val in kwargs.values()])
+        sql_query = self.get_insert_query(table_name, tuple(kwargs.keys()))
+        values = [update_type(val) for val in kwargs.values()]
+
+        if self.writer:
+            self.writer.put(self, sql_query, values)
+        elif self.bulk:
+            self.buffer.append((sql_query, values))
+            if len(self.buffer) >= self.batch_size:
+                self.write_buffer()
+        else:
+            self.execute(sql_query, values)
         logger.debug("Updating {} table with data: {}".format(table_name, list(kwargs.values())))
 
+    def write_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        table_name = self.correct_table_name(fetcher_type.value)
+        df = df.assign(**{column: df[column].fillna('') if column in df.columns else ''
+                          for column in ['adm_area_1', 'adm_area_2', 'adm_area_3']})
+        if 'gid' in df.columns:
+            df = df.assign(gid=df['gid'].map(lambda gid: ",".join(gid) if isinstance(gid, list) and gid else None))
+
+        sql_query = self.get_insert_query(table_name, tuple(df.columns))
+        rows = [list(row.values()) for row in self.frame_records(df)]
+        if self.writer:
+            for values in rows:
+                self.writer.put(self, sql_query, values)
+        elif self.bulk:
+            self.buffer.extend((sql_query, values) for values in rows)
+            if len(self.buffer) >= self.batch_size:
+                self.write_buffer()
+        else:
+            self.execute_many(sql_query, rows)
+            self.conn.commit()
+        logger.debug(f"Updating {table_name} table with {len(rows)} rows")
+
+    def write_buffer(self):
+        # Consecutive rows sharing a statement go in one executemany, keeping the order of the upserts
+        for sql_query, rows in groupby(self.buffer, key=itemgetter(0)):
+            self.execute_many(sql_query, [values for _, values in rows])
+        self.buffer = []
+
+    def flush_data(self):
+        if self.writer:
+            self.writer.join(self)
+        elif self.bulk:
+            # The whole plugin run is a single transaction, committed here or rolled back if a statement failed
+            with self.lock:
+                self.write_buffer()
+                if self.error:
+                    self.conn.rollback()
+                else:
+                    self.conn.commit()
+        # Statements that failed since the last flush fail the flush, so their rows aren't taken as written
+        if self.error:
+            error, self.error = self.error, None
+            raise error
+
     def upsert_government_response_data(self, table_name: str = 'government_response', **kwargs):
         self.upsert_table_data(table_name, **kwargs)
 
@@ -280,32 +270,36 @@ class SqliteHelper(AbstractAdapter):
         self.upsert_table_data(table_name, **kwargs)
 
     def upsert_diagnostics(self, **kwargs):
-        sql_query = """INSERT OR REPLACE INTO covid19_schema.diagnostics ({insert_keys}) VALUES ({insert_data})""".format(
+        sql_query = """INSERT OR REPLACE INTO diagnostics ({insert_keys}) VALUES ({insert_data})""".format(
             insert_keys=",".join([key for key in kwargs.keys()]),
             insert_data=",".join('?' * len(kwargs)),
         )
-        self.execute(sql_query, [update_type(val) for val in kwargs.values()])
+        if self.writer:
+            self.writer.put(self, sql_query, [update_type(val) for val in kwargs.values()])
+        else:
+            self.execute(sql_query, [update_type(val) for val in kwargs.values()])
+            self.conn.commit()
         logger.debug("Updating diagnostics table with data: {}".format(list(kwargs.values())))
 
     def get_earliest_timestamp(self, table_name: str, source: str = None):
-        sql_str = """SELECT min(date) as date FROM covid19_schema.{table_name}"""
+        sql_str = """SELECT min(date) as date FROM {table_name}"""
         if source:
-            sql_str = sql_str + """ WHERE source = %s"""
+            sql_str = sql_str + """ WHERE source = ?"""
 
         sql_query = sql_str.format(table_name=table_name)
 
-        result = self.execute(sql_query, (source,))
-        return result[0]['date'] if len(result) > 0 else None
+        result = self.execute(sql_query, (source,) if source else None)
+        return result[0][0] if len(result) > 0 else None
 
     def get_latest_timestamp(self, table_name: str, source: str = None):
-        sql_str = """SELECT max(date) as date FROM covid19_schema.{table_name}"""
+        sql_str = """SELECT max(date) as date FROM {table_name}"""
         if source:
-            sql_str = sql_str + """ WHERE source = %s"""
+            sql_str = sql_str + """ WHERE source = ?"""
 
         sql_query = sql_str.format(table_name=table_name)
 
-        result = self.execute(sql_query, (source,))
-        return result[0]['date'] if len(result) > 0 else None
+        result = self.execute(sql_query, (source,) if source else None)
+        return result[0][0] if len(result) > 0 else None
 
     def close_connection(self):
         if self.conn:
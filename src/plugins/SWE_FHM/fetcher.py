@@ -148,15 +148,10 @@ class SWE_FHMFetcher(BaseEpidemiologyFetcher):
         adm_2 = self.get_adm_areas(2)
         adm_3 = self.get_adm_areas(3)
 
-        today = date.today()
-
-        # Calculate how many days of data should be fetched
-        if self.sliding_window_days:
-            # Number of days in the past to process
-            sliding_window_days = self.sliding_window_days
-        else:
-            # Number of days since first FHM data (2020-03-05)
-            sliding_window_days = (today - date(2020, 3, 5)).days
+        # Calculate how many days of data should be fetched, since first FHM data (2020-03-05), the sliding window
+        # or the last run
+        date_from, today = self.get_date_range_to_fetch('2020-03-05')
+        sliding_window_days = max((today - date_from).days, 1)
 
         
         # For each days since today
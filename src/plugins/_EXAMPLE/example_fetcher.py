@@ -76,3 +76,22 @@ class ExampleFetcher(BaseEpidemiologyFetcher):
 
             # alternatively, we can issue the query directly using self.db.execute(query, data)
             # but use it with care!
+
+    def run_vectorized(self):
+        data = self.fetch()
+
+        # a DataFrame with the same columns as the upsert object can be written in a single call,
+        # the columns are checked and converted to the table types once for the whole frame
+        df = pd.DataFrame({
+            'source': self.SOURCE,
+            'date': data.iloc[:, 0],
+            'country': data.iloc[:, 1],
+            'countrycode': 'CDN',
+            'adm_area_1': data.iloc[:, 2],
+            'confirmed': data.iloc[:, 3],
+            'dead': data.iloc[:, 4],
+            'recovered': data.iloc[:, 5]
+        })
+        # the regions are translated and their gid added once per distinct province, not once per row
+        df = self.get_regions(df)
+        self.upsert_frame(df)
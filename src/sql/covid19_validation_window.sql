@@ -0,0 +1,68 @@
+-- FUNCTION: covid19_schema.covid19_validation_window(text)
+
+-- DROP FUNCTION covid19_schema.covid19_validation_window(text);
+
+-- validation function for incoming data: only the date range staged for the source is compared against the
+-- epidemiology table, one aggregate hash per date, so the cost follows the size of the fetched window and not
+-- the full history of the source. Returns the number of dates whose content differs, 0 means valid.
+
+CREATE INDEX IF NOT EXISTS epidemiology_source_date_idx
+    ON covid19_schema.epidemiology (source, date);
+
+CREATE INDEX IF NOT EXISTS staging_epidemiology_source_date_idx
+    ON covid19_schema.staging_epidemiology (source, date);
+
+CREATE OR REPLACE FUNCTION covid19_schema.covid19_validation_window(
+	source_code text)
+    RETURNS integer
+    LANGUAGE 'plpgsql'
+
+    COST 100
+    VOLATILE
+
+AS $BODY$
+
+DECLARE
+valid_flag integer := 0;
+date_from date;
+date_to date;
+BEGIN
+  select min(date), max(date) into date_from, date_to
+    from staging_epidemiology
+   where staging_epidemiology.source = source_code;
+
+  if date_from is null then
+    return 0;
+  end if;
+
+  with A as (
+    select staging_epidemiology.date as d,
+           count(*) as c,
+           sum(hashtext(textin(record_out(staging_epidemiology)))::bigint) as h
+      from staging_epidemiology
+     where staging_epidemiology.source = source_code
+       and staging_epidemiology.date between date_from and date_to
+     group by 1
+),
+ B as (
+    select epidemiology.date as d,
+           count(*) as c,
+           sum(hashtext(textin(record_out(epidemiology)))::bigint) as h
+      from epidemiology
+     where epidemiology.source = source_code
+       and epidemiology.date between date_from and date_to
+     group by 1
+)
+select count(*) into valid_flag
+  from A full outer join B on (A.d = B.d)
+ where A.d is null
+    or (B.d is not null and (A.c <> B.c or A.h <> B.h));
+ raise notice 'Value: %', valid_flag;
+
+ return valid_flag;
+
+END
+$BODY$;
+
+ALTER FUNCTION covid19_schema.covid19_validation_window(text)
+    OWNER TO covid19_read_write;
@@ -0,0 +1,89 @@
+-- Per-source watermarks used by diagnostics.
+--
+-- source_watermark keeps, for every (table, source, country), the earliest and latest date and the number of
+-- rows. It is maintained by an AFTER INSERT trigger on the fact tables, so only new rows touch it (updates of
+-- existing rows change neither the dates nor the row count), and diagnostics read it instead of scanning the
+-- fact tables. PostgresqlSchemaManager.migrate_to_partitioned() moves the triggers to the partitioned tables.
+
+CREATE TABLE IF NOT EXISTS covid19_schema.source_watermark (
+    table_name text NOT NULL,
+    source text NOT NULL,
+    country text NOT NULL,
+    min_date date NOT NULL,
+    max_date date NOT NULL,
+    row_count bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, source, country)
+);
+
+ALTER TABLE covid19_schema.source_watermark
+    OWNER TO covid19_read_write;
+
+
+-- FUNCTION: covid19_schema.update_source_watermark()
+
+-- DROP FUNCTION covid19_schema.update_source_watermark();
+
+CREATE OR REPLACE FUNCTION covid19_schema.update_source_watermark()
+    RETURNS trigger
+    LANGUAGE 'plpgsql'
+
+    COST 100
+    VOLATILE
+
+AS $BODY$
+
+BEGIN
+	insert into covid19_schema.source_watermark (table_name, source, country, min_date, max_date, row_count)
+	values (TG_ARGV[0], NEW.source, NEW.country, NEW.date, NEW.date, 1)
+	on conflict (table_name, source, country)
+	DO
+		UPDATE
+			SET min_date  = LEAST(source_watermark.min_date, EXCLUDED.min_date),
+				max_date  = GREATEST(source_watermark.max_date, EXCLUDED.max_date),
+				row_count = source_watermark.row_count + 1;
+	return NULL;
+END
+$BODY$;
+
+ALTER FUNCTION covid19_schema.update_source_watermark()
+    OWNER TO covid19_read_write;
+
+
+DROP TRIGGER IF EXISTS epidemiology_watermark ON covid19_schema.epidemiology;
+CREATE TRIGGER epidemiology_watermark AFTER INSERT ON covid19_schema.epidemiology
+    FOR EACH ROW EXECUTE PROCEDURE covid19_schema.update_source_watermark('epidemiology');
+
+DROP TRIGGER IF EXISTS epidemiology_england_msoa_watermark ON covid19_schema.epidemiology_england_msoa;
+CREATE TRIGGER epidemiology_england_msoa_watermark AFTER INSERT ON covid19_schema.epidemiology_england_msoa
+    FOR EACH ROW EXECUTE PROCEDURE covid19_schema.update_source_watermark('epidemiology_england_msoa');
+
+DROP TRIGGER IF EXISTS mobility_watermark ON covid19_schema.mobility;
+CREATE TRIGGER mobility_watermark AFTER INSERT ON covid19_schema.mobility
+    FOR EACH ROW EXECUTE PROCEDURE covid19_schema.update_source_watermark('mobility');
+
+DROP TRIGGER IF EXISTS government_response_watermark ON covid19_schema.government_response;
+CREATE TRIGGER government_response_watermark AFTER INSERT ON covid19_schema.government_response
+    FOR EACH ROW EXECUTE PROCEDURE covid19_schema.update_source_watermark('government_response');
+
+-- weather is written outside of covid19_schema, see PostgresqlHelper.upsert_weather_data()
+DROP TRIGGER IF EXISTS weather_watermark ON weather;
+CREATE TRIGGER weather_watermark AFTER INSERT ON weather
+    FOR EACH ROW EXECUTE PROCEDURE covid19_schema.update_source_watermark('weather');
+
+
+-- Backfill from the existing data, run once after creating the triggers
+
+INSERT INTO covid19_schema.source_watermark (table_name, source, country, min_date, max_date, row_count)
+SELECT 'epidemiology', source, country, min(date), max(date), count(*) FROM covid19_schema.epidemiology GROUP BY 2, 3
+UNION ALL
+SELECT 'epidemiology_england_msoa', source, country, min(date), max(date), count(*)
+  FROM covid19_schema.epidemiology_england_msoa GROUP BY 2, 3
+UNION ALL
+SELECT 'mobility', source, country, min(date), max(date), count(*) FROM covid19_schema.mobility GROUP BY 2, 3
+UNION ALL
+SELECT 'government_response', source, country, min(date), max(date), count(*)
+  FROM covid19_schema.government_response GROUP BY 2, 3
+UNION ALL
+SELECT 'weather', source, country, min(date), max(date), count(*) FROM weather GROUP BY 2, 3
+ON CONFLICT (table_name, source, country) DO
+    UPDATE SET min_date = EXCLUDED.min_date, max_date = EXCLUDED.max_date, row_count = EXCLUDED.row_count;
@@ -0,0 +1,65 @@
+-- Per-source staging for incoming epidemiology data.
+--
+-- staging_epidemiology becomes a LIST partitioned table with one partition per source
+-- (staging_epidemiology_<source>). The fetchers create and truncate the partition of the
+-- source they are running, so several sources can stage and validate at the same time
+-- without wiping each other's rows.
+
+BEGIN;
+
+ALTER TABLE IF EXISTS covid19_schema.staging_epidemiology RENAME TO staging_epidemiology_old;
+
+CREATE TABLE covid19_schema.staging_epidemiology (
+    LIKE covid19_schema.staging_epidemiology_old INCLUDING DEFAULTS
+) PARTITION BY LIST (source);
+
+CREATE UNIQUE INDEX staging_epidemiology_conflict_idx ON covid19_schema.staging_epidemiology
+    (date, country, countrycode, COALESCE(adm_area_1, ''), COALESCE(adm_area_2, ''), COALESCE(adm_area_3, ''), source);
+
+DROP TABLE covid19_schema.staging_epidemiology_old;
+
+ALTER TABLE covid19_schema.staging_epidemiology
+    OWNER TO covid19_read_write;
+
+COMMIT;
+
+
+-- FUNCTION: covid19_schema.send_validated_data(text)
+
+-- DROP FUNCTION covid19_schema.send_validated_data(text);
+
+-- Moves validated rows of a single source from its staging partition into the epidemiology table
+
+CREATE OR REPLACE FUNCTION covid19_schema.send_validated_data(
+	source_code text)
+    RETURNS void
+    LANGUAGE 'plpgsql'
+
+    COST 100
+    VOLATILE
+
+AS $BODY$
+
+BEGIN
+	insert into epidemiology (select * from staging_epidemiology where staging_epidemiology.source = source_code)
+	on conflict (date, country, countrycode, COALESCE(adm_area_1, ''), COALESCE(adm_area_2, ''), COALESCE(adm_area_3, ''), source)
+	DO
+		UPDATE
+			SET gid              = EXCLUDED.gid,
+				tested           = EXCLUDED.tested,
+				confirmed        = EXCLUDED.confirmed,
+				quarantined      = EXCLUDED.quarantined,
+				dead             = EXCLUDED.dead,
+				recovered        = EXCLUDED.recovered,
+				hospitalised     = EXCLUDED.hospitalised,
+				hospitalised_icu = EXCLUDED.hospitalised_icu
+			WHERE (epidemiology.gid, epidemiology.tested, epidemiology.confirmed, epidemiology.quarantined,
+				   epidemiology.dead, epidemiology.recovered, epidemiology.hospitalised, epidemiology.hospitalised_icu)
+				IS DISTINCT FROM
+				  (EXCLUDED.gid, EXCLUDED.tested, EXCLUDED.confirmed, EXCLUDED.quarantined,
+				   EXCLUDED.dead, EXCLUDED.recovered, EXCLUDED.hospitalised, EXCLUDED.hospitalised_icu);
+END
+$BODY$;
+
+ALTER FUNCTION covid19_schema.send_validated_data(text)
+    OWNER TO covid19_read_write;
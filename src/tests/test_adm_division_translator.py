@@ -65,3 +65,17 @@ class AdmDivisionTranslatorTestCase(unittest.TestCase):
         self.assertIsNone(adm_area_2)
         self.assertIsNone(adm_area_3)
         self.assertIsNone(gid)
+
+    def test_adm_division_translation_countrycode(self):
+        translator = AdmTranslator(csv_fname=StringIO(
+            "countrycode,input_adm_area_1,input_adm_area_2,input_adm_area_3,adm_area_1,adm_area_2,adm_area_3,gid\n"
+            "USA,Georgia,,,Georgia,,,USA.11_1\n"
+            "GEO,Georgia,,,,,,GEO"))
+
+        self.assertEqual(translator.tr(country_code='GEO', input_adm_area_1='GEORGIA'),
+                         (True, None, None, None, ['GEO']))
+        self.assertEqual(translator.tr(country_code='USA', input_adm_area_1='Georgia')[-1], ['USA.11_1'])
+        self.assertFalse(translator.tr(country_code='FRA', input_adm_area_1='Georgia')[0])
+        # Failures are cached too, the result still depends on return_original_if_failure
+        self.assertEqual(translator.tr(country_code='FRA', input_adm_area_1='Georgia',
+                                       return_original_if_failure=True), (False, 'Georgia', None, None, None))
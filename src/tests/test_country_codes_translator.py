@@ -1,6 +1,7 @@
 import unittest
+import pandas as pd
 
-from utils.country_codes_translator.translator import CountryCodesTranslator
+from utils.country_codes_translator.translator import CountryCodesTranslator, NAME
 
 
 class CountryCodesTranslatorTestCase(unittest.TestCase):
@@ -27,3 +28,14 @@ class CountryCodesTranslatorTestCase(unittest.TestCase):
         country, countrycode = self.translator.get_country_info()
         self.assertIsNone(country)
         self.assertIsNone(countrycode)
+
+    def test_translation_country_a3_code(self):
+        self.assertEqual(self.translator.get_country_info(country_a3_code='NAM'), ('Namibia', 'NAM'))
+        self.assertEqual(self.translator.get_country_info(country_a2_code='NA'), ('Namibia', 'NAM'))
+
+    def test_translate_series(self):
+        df = self.translator.translate_series(pd.Series(['united  kingdom', None, 'Unknown'], index=[3, 4, 5]), NAME)
+        self.assertEqual(list(df.index), [3, 4, 5])
+        self.assertEqual(list(df.country), ['United Kingdom', None, None])
+        self.assertEqual(list(df.countrycode), ['GBR', None, None])
+        self.assertEqual(list(self.translator.translate_series(pd.Series(['SE', 'NA'])).countrycode), ['SWE', 'NAM'])
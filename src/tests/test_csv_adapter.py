@@ -0,0 +1,60 @@
+import os
+import unittest
+import tempfile
+import pandas as pd
+
+from utils.types import FetcherType
+from adapters.csvfile import CSVFileHelper
+
+
+class CSVAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.adapter = CSVFileHelper(csv_path=self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def upsert(self, date: str, adm_area_1: str = None, **kwargs):
+        self.adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date=date, country='United Kingdom',
+                                 countrycode='GBR', adm_area_1=adm_area_1, **kwargs)
+
+    def read_csv(self) -> pd.DataFrame:
+        return pd.read_csv(os.path.join(self.tmp_dir.name, 'epidemiology_GBR_PHE.csv'))
+
+    def test_upsert(self):
+        self.upsert('2020-05-01', confirmed=10)
+        self.upsert('2020-05-01', 'England', gid=['GBR.1_1'], confirmed=8)
+        self.upsert('2020-05-01', dead=2)
+        self.upsert('2020-05-02', confirmed=12)
+        self.adapter.flush()
+
+        df = self.read_csv()
+        self.assertEqual(len(df), 3)
+        self.assertEqual(list(df.columns[:4]), ['source', 'date', 'country', 'countrycode'])
+
+        row = df[(df.date == '2020-05-01') & df.adm_area_1.isnull()].iloc[0]
+        self.assertEqual(row.confirmed, 10)
+        self.assertEqual(row.dead, 2)
+        self.assertEqual(df[df.adm_area_1 == 'England'].iloc[0].gid, 'GBR.1_1')
+
+    def test_merge_with_existing_file(self):
+        self.adapter = CSVFileHelper(csv_path=self.tmp_dir.name, merge=True)
+        for day in range(1, 4):
+            self.upsert(f'2020-05-0{day}', confirmed=day, dead=0)
+        self.adapter.flush()
+
+        self.adapter = CSVFileHelper(csv_path=self.tmp_dir.name, merge=True)
+        self.upsert('2020-05-04', confirmed=4)
+        self.upsert('2020-05-03', confirmed=30)
+        self.upsert('2020-05-01', 'England', confirmed=1)
+        self.adapter.flush()
+
+        df = self.read_csv()
+        self.assertEqual(len(df), 5)
+        self.assertEqual(list(df.date), ['2020-05-01', '2020-05-01', '2020-05-02', '2020-05-03', '2020-05-04'])
+        row = df[df.date == '2020-05-03'].iloc[0]
+        self.assertEqual(row.confirmed, 30)
+        self.assertEqual(row.dead, 0)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['epidemiology_GBR_PHE.csv'])
@@ -0,0 +1,101 @@
+import os
+import unittest
+import tempfile
+import threading
+import pandas as pd
+from unittest import mock
+
+from utils.config import config
+from utils.types import FetcherType
+from adapters.fanout import FanOutHelper
+from adapters.memory import MemoryHelper
+from adapters.csvfile import CSVFileHelper
+from adapters.sqlite import SqliteHelper
+from utils.diagnostics import Diagnostics
+from utils.fetcher.base_epidemiology import BaseEpidemiologyFetcher
+
+
+class FailingHelper(MemoryHelper):
+
+    def upsert_table_data(self, table_name: str, **kwargs):
+        raise ValueError('write failed')
+
+
+class DiagnosticsFetcher(BaseEpidemiologyFetcher):
+    LOAD_PLUGIN = False
+    SOURCE = 'GBR_PHE'
+
+
+class FanOutAdapterTestCase(unittest.TestCase):
+
+    def upsert(self, adapter, day: int):
+        adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date=f'2020-05-0{day}',
+                            country='United Kingdom', countrycode='GBR', adm_area_1='England', gid=['GBR.1_1'],
+                            confirmed=day)
+
+    def test_writes_all_adapters(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            memory = MemoryHelper()
+            # SQLite is created on this thread and written by its own writer thread
+            sqlite = SqliteHelper(sqlite_file_path=os.path.join(tmp_dir, 'covid19.sqlite'))
+            adapter = FanOutHelper([memory, CSVFileHelper(csv_path=tmp_dir), sqlite], queue_size=2)
+            for day in range(1, 6):
+                self.upsert(adapter, day)
+            adapter.flush()
+
+            self.assertEqual(len(memory.tables['epidemiology']), 5)
+            df = pd.read_csv(os.path.join(tmp_dir, 'epidemiology_GBR_PHE.csv'))
+            self.assertEqual(list(df.confirmed), [1, 2, 3, 4, 5])
+            self.assertEqual(sqlite.execute('SELECT confirmed FROM epidemiology ORDER BY date'),
+                             [(1,), (2,), (3,), (4,), (5,)])
+
+            # Reads go to the primary adapter on its writer thread
+            self.assertEqual(adapter.get_adm_division('GBR', 'england')[-1], ['GBR.1_1'])
+            adapter.close()
+
+    def test_adapters_only_used_from_writer_threads(self):
+        threads = set()
+
+        class RecordingHelper(MemoryHelper):
+            def upsert_table_data(self, table_name: str, **kwargs):
+                threads.add(threading.current_thread().name)
+                super().upsert_table_data(table_name, **kwargs)
+
+        adapter = FanOutHelper([RecordingHelper(), RecordingHelper()])
+        self.upsert(adapter, 1)
+        adapter.flush()
+        adapter.close()
+        self.assertEqual(threads, {'fanout-RecordingHelper'})
+
+    def test_background_error_raised_on_flush(self):
+        memory = MemoryHelper()
+        adapter = FanOutHelper([memory, FailingHelper()])
+        self.upsert(adapter, 1)
+        with self.assertRaises(ValueError):
+            adapter.flush()
+        self.assertEqual(len(memory.tables['epidemiology']), 1)
+        adapter.close()
+
+    def test_thread_safe_reads_skip_the_queue(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sqlite = SqliteHelper(sqlite_file_path=os.path.join(tmp_dir, 'covid19.sqlite'))
+            adapter = FanOutHelper([sqlite, MemoryHelper()])
+            self.upsert(adapter, 1)
+            adapter.flush()
+            with mock.patch.object(adapter.writers[0], 'call') as call:
+                self.assertEqual(str(adapter.get_latest_timestamp('epidemiology', 'GBR_PHE')), '2020-05-01')
+            call.assert_not_called()
+            adapter.close()
+
+    def test_diagnostics_stored_by_supporting_adapters(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            memory = MemoryHelper()
+            adapter = FanOutHelper([CSVFileHelper(csv_path=tmp_dir), memory])
+            with mock.patch.object(config, 'CSV', True):
+                Diagnostics(DiagnosticsFetcher(adapter)).update_diagnostics_info(
+                    validation=True, error=False, start_time=0, end_time=1)
+            adapter.close()
+
+        diagnostics = memory.diagnostics[('epidemiology', 'GBR_PHE')]
+        self.assertTrue(diagnostics['validation_success'])
+        self.assertIsNone(diagnostics['last_timestamp'])
@@ -0,0 +1,147 @@
+import os
+import unittest
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+
+from utils.config import config
+from utils.types import FetcherType
+from utils.fetch_state import FetchState
+from adapters.memory import MemoryHelper
+from adapters.sqlite import SqliteHelper
+from utils.fetcher.base_epidemiology import BaseEpidemiologyFetcher
+
+
+class WatermarkFetcher(BaseEpidemiologyFetcher):
+    LOAD_PLUGIN = False
+    SOURCE = 'GBR_TEST'
+
+
+class FetchStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_file_path = os.path.join(self.tmp_dir.name, 'fetch_state.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_state_is_persisted(self):
+        FetchState(self.state_file_path).update('GBR_TEST', fetched_until='2020-05-03')
+        self.assertEqual(FetchState(self.state_file_path).get('GBR_TEST'), {'fetched_until': '2020-05-03'})
+        self.assertEqual(FetchState(self.state_file_path).get('GBR_OTHER'), {})
+
+    def test_date_range_to_fetch(self):
+        adapter = MemoryHelper()
+        latest = date.today() - timedelta(days=10)
+        adapter.upsert_epidemiology_data(date=latest.isoformat(), country='United Kingdom', countrycode='GBR',
+                                         source='GBR_TEST', confirmed=1)
+        fetcher = WatermarkFetcher(adapter)
+        fetcher.sliding_window_days = None
+
+        with mock.patch.object(config, 'FETCH_STATE', self.state_file_path):
+            with mock.patch.object(config, 'INCREMENTAL_FETCH', False):
+                self.assertEqual(fetcher.get_date_range_to_fetch('2020-03-01'), (date(2020, 3, 1), date.today()))
+
+            with mock.patch.object(config, 'INCREMENTAL_FETCH', True):
+                # Without fetch state the latest date stored is used
+                self.assertEqual(fetcher.get_date_range_to_fetch('2020-03-01'), (latest, date.today()))
+
+                fetcher.save_fetch_state()
+                self.assertEqual(fetcher.get_date_range_to_fetch('2020-03-01'), (date.today(), date.today()))
+
+                # A sliding window is still fetched as a whole
+                fetcher.sliding_window_days = 3
+                self.assertEqual(fetcher.get_date_range_to_fetch('2020-03-01'),
+                                 (date.today() - timedelta(days=3), date.today()))
+
+    def test_adaptive_sliding_window(self):
+        adapter = MemoryHelper()
+        revised = date.today() - timedelta(days=5)
+        row = dict(date=revised.isoformat(), country='United Kingdom', countrycode='GBR', source='GBR_TEST')
+        adapter.upsert_epidemiology_data(confirmed=1, **row)
+        adapter.upsert_epidemiology_data(confirmed=2, **row)
+        adapter.upsert_epidemiology_data(confirmed=1, **dict(row, date=date.today().isoformat()))
+
+        with mock.patch.object(config, 'FETCH_STATE', self.state_file_path), \
+                mock.patch.object(config, 'ADAPTIVE_SLIDING_WINDOW', True), \
+                mock.patch.object(config, 'SLIDING_WINDOW_MARGIN_DAYS', 2):
+            self.assertIsNone(WatermarkFetcher(adapter).sliding_window_days)
+            WatermarkFetcher(adapter).save_fetch_state()
+            # The next run without revisions still keeps the window of the runs before
+            WatermarkFetcher(adapter).save_fetch_state()
+
+            self.assertEqual(FetchState(self.state_file_path).get('GBR_TEST')['revision_depths'], [5, 0])
+            self.assertEqual(WatermarkFetcher(adapter).sliding_window_days, 7)
+            self.assertTrue(adapter.date_in_window(dict(row, date=(date.today() - timedelta(days=6)).isoformat())))
+            self.assertFalse(adapter.date_in_window(dict(row, date=(date.today() - timedelta(days=8)).isoformat())))
+
+    def test_adaptive_window_bounds(self):
+        adapter = MemoryHelper()
+        FetchState(self.state_file_path).update('GBR_TEST', revision_depths=[5, 0], runs_since_probe=2)
+
+        with mock.patch.object(config, 'FETCH_STATE', self.state_file_path), \
+                mock.patch.object(config, 'ADAPTIVE_SLIDING_WINDOW', True), \
+                mock.patch.object(config, 'ADAPTIVE_SLIDING_WINDOW_RUNS', 3), \
+                mock.patch.object(config, 'SLIDING_WINDOW_MARGIN_DAYS', 2):
+            with mock.patch.object(config, 'SLIDING_WINDOW_DAYS', 30):
+                self.assertEqual(WatermarkFetcher(adapter).sliding_window_days, 30)
+
+            WatermarkFetcher(adapter).save_fetch_state()
+            # Every ADAPTIVE_SLIDING_WINDOW_RUNS runs all dates are fetched again
+            fetcher = WatermarkFetcher(adapter)
+            self.assertIsNone(fetcher.sliding_window_days)
+            self.assertEqual(fetcher.get_date_range_to_fetch('2020-03-01'), (date(2020, 3, 1), date.today()))
+            self.assertTrue(adapter.date_in_window(dict(source='GBR_TEST', date='2020-03-01')))
+
+            row = dict(date=(date.today() - timedelta(days=20)).isoformat(), country='United Kingdom',
+                       countrycode='GBR', source='GBR_TEST')
+            adapter.upsert_epidemiology_data(confirmed=1, **row)
+            adapter.upsert_epidemiology_data(confirmed=2, **row)
+            fetcher.save_fetch_state()
+            self.assertEqual(FetchState(self.state_file_path).get('GBR_TEST')['runs_since_probe'], 0)
+            self.assertEqual(WatermarkFetcher(adapter).sliding_window_days, 22)
+
+    def test_revisions_outside_window_are_counted(self):
+        adapter = SqliteHelper(sqlite_file_path=os.path.join(self.tmp_dir.name, 'covid19.sqlite'))
+        adapter.use_fingerprint_cache(os.path.join(self.tmp_dir.name, 'fingerprints.sqlite'))
+        revised = date.today() - timedelta(days=5)
+        row = dict(date=revised.isoformat(), country='United Kingdom', countrycode='GBR', source='GBR_TEST')
+        adapter.upsert_data(FetcherType.EPIDEMIOLOGY, confirmed=1, **row)
+        adapter.flush()
+
+        adapter.set_sliding_window('GBR_TEST', 3)
+        adapter.upsert_data(FetcherType.EPIDEMIOLOGY, confirmed=2, **row)
+        adapter.flush()
+        self.assertEqual(adapter.pop_revision('GBR_TEST'), revised)
+        self.assertEqual(adapter.execute('SELECT confirmed FROM epidemiology'), [(1,)])
+
+    def test_adaptive_window_needs_revisions(self):
+        FetchState(self.state_file_path).update('GBR_TEST', revision_depths=[5, 0])
+        sqlite_file_path = os.path.join(self.tmp_dir.name, 'covid19.sqlite')
+
+        with mock.patch.object(config, 'FETCH_STATE', self.state_file_path), \
+                mock.patch.object(config, 'ADAPTIVE_SLIDING_WINDOW', True), \
+                mock.patch.object(config, 'SLIDING_WINDOW_DAYS', 30):
+            with self.assertLogs('utils.fetcher.abstract_fetcher', 'WARNING'):
+                fetcher = WatermarkFetcher(SqliteHelper(sqlite_file_path=sqlite_file_path))
+            self.assertEqual(fetcher.sliding_window_days, 30)
+            fetcher.save_fetch_state()
+            self.assertEqual(FetchState(self.state_file_path).get('GBR_TEST')['revision_depths'], [5, 0])
+
+            # Staging tables are truncated before every run
+            with mock.patch.object(config, 'VALIDATE_INPUT_DATA', True):
+                self.assertEqual(WatermarkFetcher(MemoryHelper()).sliding_window_days, 30)
+
+            adapter = SqliteHelper(sqlite_file_path=sqlite_file_path)
+            adapter.use_fingerprint_cache(os.path.join(self.tmp_dir.name, 'fingerprints.sqlite'))
+            self.assertEqual(WatermarkFetcher(adapter).sliding_window_days, 30)
+            with mock.patch.object(config, 'SLIDING_WINDOW_DAYS', None):
+                self.assertEqual(WatermarkFetcher(adapter).sliding_window_days, 8)
+
+    def test_state_saved_only_when_used(self):
+        with mock.patch.object(config, 'FETCH_STATE', self.state_file_path), \
+                mock.patch.object(config, 'INCREMENTAL_FETCH', False), \
+                mock.patch.object(config, 'ADAPTIVE_SLIDING_WINDOW', False):
+            WatermarkFetcher(MemoryHelper()).save_fetch_state()
+        self.assertFalse(os.path.exists(self.state_file_path))
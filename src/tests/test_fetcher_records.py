@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+import pandas as pd
+
+from adapters.memory import MemoryHelper
+from utils.fetcher.base_epidemiology import BaseEpidemiologyFetcher
+
+
+class RecordsFetcher(BaseEpidemiologyFetcher):
+    LOAD_PLUGIN = False
+    SOURCE = 'GBR_TEST'
+
+    def records(self):
+        for day in range(1, 4):
+            yield {'date': f'2020-05-0{day}', 'country': 'United Kingdom', 'countrycode': 'GBR',
+                   'adm_area_1': 'England', 'gid': ['GBR.1_1'], 'confirmed': day}
+        # A later record of the same row updates it, without clearing the values it doesn't have
+        yield {'date': '2020-05-03', 'country': 'United Kingdom', 'countrycode': 'GBR',
+               'adm_area_1': 'England', 'gid': ['GBR.1_1'], 'dead': 1}
+        yield pd.DataFrame({'date': ['2020-05-04'], 'country': 'United Kingdom', 'countrycode': 'GBR',
+                            'confirmed': [4]})
+        # A frame updates the rows of the records yielded before it
+        yield {'date': '2020-05-05', 'country': 'United Kingdom', 'countrycode': 'GBR', 'confirmed': 1}
+        yield pd.DataFrame({'date': ['2020-05-05'], 'country': 'United Kingdom', 'countrycode': 'GBR',
+                            'confirmed': [2]})
+
+
+class FetcherRecordsTestCase(unittest.TestCase):
+
+    def test_run_writes_records(self):
+        adapter = MemoryHelper()
+        RecordsFetcher(adapter).run()
+
+        rows = sorted(adapter.tables['epidemiology'].values(), key=lambda row: row['date'])
+        self.assertEqual(len(rows), 5)
+        self.assertEqual((rows[2]['confirmed'], rows[2]['dead']), (3, 1))
+        self.assertEqual(rows[3]['source'], 'GBR_TEST')
+        self.assertEqual(rows[4]['confirmed'], 2)
+
+    def test_get_regions(self):
+        adapter = MemoryHelper()
+        adapter.upsert_epidemiology_data(date='2020-05-01', source='GBR_TEST', country='United Kingdom',
+                                         countrycode='GBR', adm_area_1='England', gid=['GBR.1_1'])
+        fetcher = RecordsFetcher(adapter)
+        df = pd.DataFrame({'countrycode': 'GBR', 'adm_area_1': ['england', 'Atlantis', 'england', None],
+                           'confirmed': [1, 2, 3, 4]}, index=[10, 11, 12, 13])
+
+        with mock.patch.object(adapter, 'get_adm_division', wraps=adapter.get_adm_division) as get_adm_division:
+            regions = fetcher.get_regions(df)
+        self.assertEqual(get_adm_division.call_count, 3)
+
+        self.assertEqual(list(regions.index), [10, 11, 12, 13])
+        self.assertEqual(list(regions.adm_area_1), ['England', 'Atlantis', 'England', None])
+        self.assertEqual(list(regions.gid), [['GBR.1_1'], None, ['GBR.1_1'], None])
+        self.assertEqual(list(regions.confirmed), [1, 2, 3, 4])
+        self.assertNotIn('gid', df.columns)
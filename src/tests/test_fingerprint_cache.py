@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import unittest
+import tempfile
+import pandas as pd
+
+from utils.types import FetcherType
+from adapters.sqlite import SqliteHelper
+from adapters.csvfile import CSVFileHelper
+
+
+class FingerprintCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file_path = os.path.join(self.tmp_dir.name, 'fingerprints.sqlite')
+        self.sqlite_file_path = os.path.join(self.tmp_dir.name, 'covid19.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_fetch(self, confirmed: list, adapter=None):
+        adapter = adapter or SqliteHelper(sqlite_file_path=self.sqlite_file_path)
+        adapter.use_fingerprint_cache(self.cache_file_path)
+        adapter.reset_upsert_stats()
+        for day, value in enumerate(confirmed, 1):
+            adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date=f'2020-05-0{day}',
+                                country='United Kingdom', countrycode='GBR', adm_area_1='England',
+                                gid=['GBR.1_1'], confirmed=value)
+        adapter.flush()
+        return adapter
+
+    def test_unchanged_rows_skipped(self):
+        adapter = self.run_fetch([1, 2, 3])
+        self.assertEqual(adapter.upsert_stats['unchanged'], 0)
+
+        # A new run only writes the revised and the new rows
+        adapter = self.run_fetch([1, 20, 3, 4])
+        self.assertEqual(adapter.upsert_stats['unchanged'], 2)
+        self.assertEqual(adapter.execute('SELECT confirmed FROM epidemiology ORDER BY date'),
+                         [(1,), (20,), (3,), (4,)])
+
+        adapter = self.run_fetch([1, 20, 3, 4])
+        self.assertEqual(adapter.upsert_stats['unchanged'], 4)
+
+    def test_partial_upserts_of_a_row(self):
+        def run_partial_fetch():
+            adapter = SqliteHelper(sqlite_file_path=self.sqlite_file_path)
+            adapter.use_fingerprint_cache(self.cache_file_path)
+            adapter.reset_upsert_stats()
+            row = dict(source='GBR_PHE', date='2020-05-01', country='United Kingdom', countrycode='GBR',
+                       adm_area_1='England', gid=['GBR.1_1'])
+            adapter.upsert_data(FetcherType.EPIDEMIOLOGY, confirmed=10, **row)
+            adapter.upsert_data(FetcherType.EPIDEMIOLOGY, dead=1, **row)
+            adapter.flush()
+            return adapter
+
+        run_partial_fetch()
+        for _ in range(3):
+            adapter = run_partial_fetch()
+            self.assertEqual(adapter.upsert_stats['unchanged'], 2)
+            self.assertIsNone(adapter.pop_revision('GBR_PHE'))
+
+    def test_fingerprints_are_kept_per_target(self):
+        self.run_fetch([1, 2, 3])
+
+        other = SqliteHelper(sqlite_file_path=os.path.join(self.tmp_dir.name, 'restored.sqlite'))
+        self.run_fetch([1, 2, 3], other)
+        self.assertEqual(other.upsert_stats['unchanged'], 0)
+        self.assertEqual(len(other.execute('SELECT * FROM epidemiology')), 3)
+
+    def test_fingerprints_not_stored_when_flush_fails(self):
+        class FailingHelper(SqliteHelper):
+            def flush_data(self):
+                raise ValueError('flush failed')
+
+        with self.assertRaises(ValueError):
+            self.run_fetch([1], FailingHelper(sqlite_file_path=self.sqlite_file_path))
+
+        adapter = self.run_fetch([1])
+        self.assertEqual(adapter.upsert_stats['unchanged'], 0)
+
+    def test_fingerprints_not_stored_when_write_fails(self):
+        adapter = SqliteHelper(sqlite_file_path=self.sqlite_file_path)
+        adapter.execute('DROP TABLE epidemiology')
+        with self.assertRaises(sqlite3.OperationalError):
+            self.run_fetch([1, 2], adapter)
+
+        adapter = self.run_fetch([1, 2])
+        self.assertEqual(adapter.upsert_stats['unchanged'], 0)
+        self.assertEqual(len(adapter.execute('SELECT * FROM epidemiology')), 2)
+
+    def test_disabled_when_output_is_rewritten(self):
+        csv_file_path = os.path.join(self.tmp_dir.name, 'epidemiology_GBR_PHE.csv')
+        self.run_fetch([1, 2, 3], CSVFileHelper(csv_path=self.tmp_dir.name))
+        adapter = self.run_fetch([1, 2, 3], CSVFileHelper(csv_path=self.tmp_dir.name))
+
+        self.assertIsNone(adapter.fingerprints)
+        self.assertEqual(len(pd.read_csv(csv_file_path)), 3)
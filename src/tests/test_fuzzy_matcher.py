@@ -0,0 +1,62 @@
+import os
+import unittest
+import tempfile
+from unittest import mock
+
+from utils.config import config
+from utils.translation_registry import translation_registry
+from adapters.memory import MemoryHelper
+from utils.fetcher.base_epidemiology import BaseEpidemiologyFetcher
+from utils.administrative_division_translator.fuzzy_matcher import FuzzyMatcher
+
+DIVISIONS = [
+    ('Sweden', 'Västra Götaland', None, None, ['SWE.21_1']),
+    ('Sweden', 'Västra Götaland', 'Göteborg', None, ['SWE.21.11_1']),
+    ('Sweden', 'Östergötland', None, None, ['SWE.14_1']),
+    ('Sweden', 'Skåne', None, None, ['SWE.13_1']),
+]
+
+
+class FuzzyFetcher(BaseEpidemiologyFetcher):
+    LOAD_PLUGIN = False
+    SOURCE = 'SWE_TEST'
+
+
+class FuzzyMatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        translation_registry.clear()
+        self.tmp_dir.cleanup()
+
+    def test_match(self):
+        matcher = FuzzyMatcher(DIVISIONS, threshold=85)
+        self.assertEqual(matcher.match('Vastra Gotalands')[-1], ['SWE.21_1'])
+        self.assertEqual(matcher.match('Västra Götaland', 'Goteborgs')[-1], ['SWE.21.11_1'])
+        self.assertEqual(matcher.match('SKANE')[-1], ['SWE.13_1'])
+        self.assertIsNone(matcher.match('Stockholm'))
+        self.assertIsNone(matcher.match())
+
+    def test_get_region(self):
+        adapter = MemoryHelper()
+        for country, adm_area_1, adm_area_2, adm_area_3, gid in DIVISIONS:
+            adapter.upsert_epidemiology_data(date='2020-05-01', source='SWE_TEST', country=country, countrycode='SWE',
+                                             adm_area_1=adm_area_1, adm_area_2=adm_area_2, gid=gid)
+        translation_csv = os.path.join(self.tmp_dir.name, 'translation.csv')
+        with mock.patch.object(FuzzyFetcher, 'TRANSLATION_CSV', translation_csv, create=True):
+            fetcher = FuzzyFetcher(adapter)
+
+            with mock.patch.object(config, 'FUZZY_MATCH', True):
+                self.assertEqual(fetcher.get_region('SWE', 'Ostergotland'),
+                                 ('Östergötland', None, None, ['SWE.14_1']))
+            # Accepted matches are kept by the translator
+            self.assertEqual(fetcher.adm_translator.tr('SWE', 'Ostergotland')[-1], ['SWE.14_1'])
+            self.assertEqual(fetcher.get_region('SWE', 'Uppsala'), ('Uppsala', None, None, None))
+
+            # and by the next runs
+            translation_registry.clear()
+            self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, 'translation_matches.csv')))
+            self.assertEqual(FuzzyFetcher(adapter).adm_translator.tr('SWE', 'Ostergotland'),
+                             (True, 'Östergötland', None, None, ['SWE.14_1']))
@@ -0,0 +1,56 @@
+import json
+import unittest
+from datetime import date
+
+from utils.types import FetcherType
+from adapters.memory import MemoryHelper
+
+
+class MemoryAdapterTestCase(unittest.TestCase):
+
+    def upsert(self, adapter: MemoryHelper, day: int, adm_area_1: str, gid: list = None, source: str = 'GBR_PHE'):
+        adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source=source, date=f'2020-05-0{day}',
+                            country='United Kingdom', countrycode='GBR', adm_area_1=adm_area_1, gid=gid,
+                            confirmed=day)
+
+    def test_rows_and_timestamps(self):
+        adapter = MemoryHelper()
+        self.upsert(adapter, 2, 'England', ['GBR.1_1'])
+        self.upsert(adapter, 1, 'Wales', ['GBR.4_1'])
+        self.upsert(adapter, 2, 'England', ['GBR.1_1'])
+        self.upsert(adapter, 9, 'Wales', source='GBR_PHW')
+
+        self.assertEqual(len(adapter.tables['epidemiology']), 3)
+        self.assertEqual(adapter.get_earliest_timestamp('epidemiology', 'GBR_PHE'), date(2020, 5, 1))
+        self.assertEqual(adapter.get_latest_timestamp('epidemiology', 'GBR_PHE'), date(2020, 5, 2))
+        self.assertEqual(adapter.get_latest_timestamp('epidemiology'), date(2020, 5, 9))
+        self.assertEqual(json.loads(adapter.get_details('epidemiology', 'GBR_PHE')),
+                         [{'country': 'United Kingdom', 'min_date': '2020-05-01', 'max_date': '2020-05-02'}])
+
+        self.assertEqual(adapter.get_adm_division('GBR', 'wales'),
+                         ('United Kingdom', 'Wales', None, None, ['GBR.4_1']))
+        with self.assertRaises(Exception):
+            adapter.get_adm_division('GBR', 'Scotland')
+
+    def test_count_only_fingerprint(self):
+        adapters = [MemoryHelper(keep_rows=False), MemoryHelper(keep_rows=False)]
+        self.upsert(adapters[0], 1, 'England')
+        self.upsert(adapters[0], 2, 'Wales')
+        self.upsert(adapters[1], 2, 'Wales')
+        self.upsert(adapters[1], 1, 'England')
+
+        stats = [adapter.stats[('epidemiology', 'GBR_PHE')] for adapter in adapters]
+        self.assertEqual(stats[0]['rows'], 2)
+        self.assertEqual(stats[0]['fingerprint'], stats[1]['fingerprint'])
+        self.assertEqual(len(adapters[0].tables), 0)
+
+    def test_write_behind_error(self):
+        class FailingHelper(MemoryHelper):
+            def upsert_table_data(self, table_name: str, **kwargs):
+                raise ValueError('write failed')
+
+        adapter = FailingHelper()
+        adapter.start_write_behind()
+        self.upsert(adapter, 1, 'England')
+        with self.assertRaises(ValueError):
+            adapter.flush()
@@ -0,0 +1,74 @@
+import json
+import unittest
+import tempfile
+from datetime import date, datetime
+import pandas as pd
+
+from utils.types import FetcherType
+from adapters.parquet import ParquetFileHelper
+from utils.diagnostics import Diagnostics
+from utils.fetcher.base_epidemiology import BaseEpidemiologyFetcher
+
+
+class DiagnosticsFetcher(BaseEpidemiologyFetcher):
+    LOAD_PLUGIN = False
+    SOURCE = 'GBR_PHE'
+
+
+class ParquetAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.adapter = ParquetFileHelper(parquet_path=self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def upsert(self, date: str, **kwargs):
+        self.adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date=date, country='United Kingdom',
+                                 countrycode='GBR', adm_area_1='England', gid=['GBR.1_1'], **kwargs)
+
+    def test_upsert_rewrites_touched_partitions(self):
+        self.upsert('2020-04-30', confirmed=5, dead=1)
+        self.upsert('2020-05-01', confirmed=10, dead=2)
+        self.adapter.flush()
+
+        self.upsert('2020-05-01', confirmed=12)
+        self.upsert('2020-05-02', confirmed=15)
+        self.adapter.flush()
+
+        df = pd.read_parquet(self.tmp_dir.name + '/epidemiology')
+        self.assertEqual(len(df), 3)
+        self.assertEqual(sorted(df.month.astype(str).unique()), ['2020-04', '2020-05'])
+        self.assertEqual(str(df.confirmed.dtype), 'Int64')
+
+        row = df[df.date == '2020-05-01'].iloc[0]
+        self.assertEqual(row.confirmed, 12)
+        self.assertEqual(row.dead, 2)
+        self.assertEqual(row.gid, 'GBR.1_1')
+
+        self.assertEqual(self.adapter.get_earliest_timestamp('epidemiology', 'GBR_PHE'), date(2020, 4, 30))
+        self.assertEqual(self.adapter.get_latest_timestamp('epidemiology', 'GBR_PHE'), date(2020, 5, 2))
+
+    def test_upsert_diagnostics(self):
+        for error in [True, False]:
+            self.adapter.upsert_diagnostics(table_name='epidemiology', source='GBR_PHE', validation_success=True,
+                                            error=error, last_run_start=datetime(2020, 5, 1, 8),
+                                            last_run_stop=datetime(2020, 5, 1, 9), first_timestamp=None,
+                                            last_timestamp=None, details=None)
+
+        df = pd.read_parquet(self.tmp_dir.name + '/diagnostics.parquet')
+        self.assertEqual(list(df.error), ['False'])
+        self.assertEqual(df.last_run_stop[0], pd.Timestamp(2020, 5, 1, 9))
+
+    def test_diagnostics_info(self):
+        self.upsert('2020-04-30', confirmed=5)
+        self.upsert('2020-05-01', confirmed=10)
+        self.adapter.flush()
+        Diagnostics(DiagnosticsFetcher(self.adapter)).update_diagnostics_info(
+            validation=True, error=False, start_time=0, end_time=1)
+
+        row = pd.read_parquet(self.tmp_dir.name + '/diagnostics.parquet').iloc[0]
+        self.assertEqual(row.source, 'GBR_PHE')
+        self.assertEqual(json.loads(row.details),
+                         [{'country': 'United Kingdom', 'min_date': '2020-04-30', 'max_date': '2020-05-01'}])
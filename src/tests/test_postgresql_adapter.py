@@ -0,0 +1,70 @@
+import unittest
+
+from psycopg2 import sql
+
+from adapters.postgresql import PostgresqlHelper, normalize_adm_area
+from adapters.postgresql_schema import PostgresqlSchemaManager
+
+
+class AdmDivisionsHelper(PostgresqlHelper):
+    # Answers the administrative_division queries without a database
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+        self.reset_adm_division_cache()
+
+    def execute(self, query, data=None, attempt: int = 0):
+        self.queries += 1
+        return [row for row in self.rows if row['countrycode'] == data[0]]
+
+
+class MigrationDb:
+    # Records the queries of a migration, with one source in the table and its watermark trigger installed
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, data=None):
+        self.queries.append(query)
+        text = query if isinstance(query, str) else repr(query)
+        if 'pg_trigger' in text:
+            return [{'count': 1}]
+        if 'array_agg' in text:
+            return [{'source': 'GBR_PHE', 'years': [2020]}]
+        return []
+
+
+class PostgresqlAdapterTestCase(unittest.TestCase):
+
+    def test_normalize_adm_area(self):
+        self.assertEqual(normalize_adm_area('Västra Götaland'), 'västragötaland')
+        self.assertEqual(normalize_adm_area("Côte-d'Or"), 'côtedor')
+        self.assertEqual(normalize_adm_area(None), '')
+
+    def test_get_adm_division(self):
+        adapter = AdmDivisionsHelper([
+            {'countrycode': 'SWE', 'country': 'Sweden', 'adm_area_1': 'Västra Götaland', 'adm_area_2': None,
+             'adm_area_3': None, 'gid': 'SWE.21_1'},
+        ])
+
+        self.assertEqual(adapter.get_adm_division('SWE', 'VÄSTRA-GÖTALAND'),
+                         ('Sweden', 'Västra Götaland', None, None, ['SWE.21_1']))
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                adapter.get_adm_division('SWE', 'Skåne')
+        self.assertEqual(adapter.queries, 1)
+
+    def test_migration_moves_watermark_trigger(self):
+        db = MigrationDb()
+        PostgresqlSchemaManager(db).migrate_to_partitioned('epidemiology')
+
+        statements = [repr(statement) for statement in db.queries[-1]]
+        trigger = [index for index, statement in enumerate(statements)
+                   if repr(sql.Identifier('epidemiology_watermark')) in statement]
+        self.assertEqual(len(trigger), 2)
+        self.assertIn('DROP TRIGGER', statements[trigger[0]])
+        self.assertIn(repr(sql.Identifier('covid19_schema', 'epidemiology_unpartitioned')), statements[trigger[0]])
+        self.assertIn('CREATE TRIGGER', statements[trigger[1]])
+        self.assertIn(repr(sql.Identifier('covid19_schema', 'epidemiology')), statements[trigger[1]])
+        # After the copy of the legacy rows, which are already counted
+        copy = [index for index, statement in enumerate(statements) if 'INSERT INTO' in statement]
+        self.assertLess(copy[0], trigger[0])
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import unittest
+import tempfile
+import pandas as pd
+
+from utils.schema import get_schema
+from adapters.sqlite import SqliteHelper
+from adapters.postgresql_schema import conflict_target
+
+
+class SchemaTestCase(unittest.TestCase):
+
+    def test_sqlite_tables(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sqlite_file_path = os.path.join(tmp_dir, 'covid19.sqlite')
+            SqliteHelper(sqlite_file_path=sqlite_file_path)
+            conn = sqlite3.connect(sqlite_file_path)
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(mobility)')]
+            conn.close()
+        self.assertEqual(columns, get_schema('mobility').column_names)
+
+    def test_coerce_frame(self):
+        df = pd.DataFrame({'date': ['2020-05-01', '2020-05-02'], 'confirmed': ['10', None],
+                           'adm_area_1': ['England', float('nan')], 'gid': [['GBR.1_1'], None], 'extra': [1, 2]})
+        df = get_schema('staging_epidemiology').coerce_frame(df)
+
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df.date))
+        self.assertEqual(str(df.confirmed.dtype), 'Int64')
+        self.assertEqual(list(df.adm_area_1), ['England', None])
+        self.assertEqual(list(df.gid), [['GBR.1_1'], None])
+        self.assertEqual(list(df.extra), [1, 2])
+
+    def test_coerce_frame_logs_changed_values(self):
+        df = pd.DataFrame({'date': ['2020-05-01'] * 3, 'c1_flag': ['10', 'n/a', 2.6],
+                           'e3_fiscal_measures': ['-', 1, 2]})
+        with self.assertLogs('utils.schema', 'WARNING') as logs:
+            df = get_schema('government_response').coerce_frame(df)
+
+        self.assertEqual(list(df.c1_flag), [10, pd.NA, 3])
+        self.assertEqual(len(logs.output), 3)
+        self.assertIn("c1_flag: 1 values not numeric, stored as null, e.g. ['n/a']", logs.output[0])
+        self.assertIn("c1_flag: 1 values rounded, e.g. ['2.6']", logs.output[1])
+        self.assertIn("e3_fiscal_measures: 1 values not numeric", logs.output[2])
+
+    def test_conflict_target(self):
+        self.assertEqual(conflict_target('epidemiology_england_msoa'),
+                         ['source', 'date', 'country', 'countrycode', "COALESCE(adm_area_1, '')",
+                          "COALESCE(adm_area_2, '')", "COALESCE(adm_area_3, '')", 'msoa'])
+        self.assertEqual(get_schema('mobility').data_keys[:2], ['gid', 'transit_stations'])
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import unittest
+import tempfile
+
+from utils.types import FetcherType
+from adapters.sqlite import SqliteHelper
+
+
+class SqliteAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sqlite_file_path = os.path.join(self.tmp_dir.name, 'covid19.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def count_rows(self, table_name: str) -> int:
+        conn = sqlite3.connect(self.sqlite_file_path)
+        try:
+            return conn.execute(f'SELECT count(*) FROM {table_name}').fetchone()[0]
+        finally:
+            conn.close()
+
+    def upsert(self, adapter: SqliteHelper, date: str, confirmed: int):
+        adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date=date, country='United Kingdom',
+                            countrycode='GBR', adm_area_1='England', gid=['GBR.1_1'], confirmed=confirmed)
+
+    def test_upsert(self):
+        adapter = SqliteHelper(sqlite_file_path=self.sqlite_file_path)
+        self.upsert(adapter, '2020-05-01', 10)
+        self.upsert(adapter, '2020-05-01', 12)
+        self.upsert(adapter, '2020-05-02', 15)
+
+        self.assertEqual(self.count_rows('epidemiology'), 2)
+        self.assertEqual(adapter.get_latest_timestamp('epidemiology', 'GBR_PHE'), '2020-05-02')
+        self.assertEqual(adapter.get_earliest_timestamp('epidemiology'), '2020-05-01')
+
+    def test_bulk_upsert_committed_on_flush(self):
+        adapter = SqliteHelper(sqlite_file_path=self.sqlite_file_path, bulk=True, batch_size=2)
+        for day in range(1, 6):
+            self.upsert(adapter, f'2020-05-0{day}', day)
+        self.upsert(adapter, '2020-05-01', 100)
+
+        self.assertEqual(self.count_rows('epidemiology'), 0)
+        adapter.flush()
+        self.assertEqual(self.count_rows('epidemiology'), 5)
+
+        result = adapter.execute("SELECT confirmed FROM epidemiology WHERE date = '2020-05-01'")
+        self.assertEqual(result, [(100,)])
+        journal_mode = adapter.execute('PRAGMA journal_mode')
+        self.assertEqual(journal_mode, [('wal',)])
+
+    def test_bulk_upsert_rolled_back_on_error(self):
+        adapter = SqliteHelper(sqlite_file_path=self.sqlite_file_path, bulk=True, batch_size=2)
+        for day in range(1, 4):
+            self.upsert(adapter, f'2020-05-0{day}', day)
+        adapter.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date='2020-05-04', country='United Kingdom',
+                            countrycode='GBR', unknown_column=1)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            adapter.flush()
+        self.assertEqual(self.count_rows('epidemiology'), 0)
+
+        # The next run starts a new transaction
+        self.upsert(adapter, '2020-05-01', 1)
+        adapter.flush()
+        self.assertEqual(self.count_rows('epidemiology'), 1)
+
+    def test_single_writer_parallel_upserts(self):
+        adapters = [SqliteHelper(sqlite_file_path=self.sqlite_file_path, single_writer=True, batch_size=10)
+                    for _ in range(4)]
+
+        def run(adapter: SqliteHelper, month: int):
+            for day in range(1, 29):
+                self.upsert(adapter, f'2020-{month:02d}-{day:02d}', day)
+            adapter.flush()
+
+        threads = [threading.Thread(target=run, args=(adapter, month)) for month, adapter in enumerate(adapters, 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIs(adapters[0].writer, adapters[1].writer)
+        self.assertEqual(self.count_rows('epidemiology'), 4 * 28)
+
+    def test_single_writer_errors_stay_with_producer(self):
+        failing, other = [SqliteHelper(sqlite_file_path=self.sqlite_file_path, single_writer=True, batch_size=10)
+                          for _ in range(2)]
+        failing.upsert_data(FetcherType.EPIDEMIOLOGY, source='GBR_PHE', date='2020-05-02', country='United Kingdom',
+                            countrycode='GBR', unknown_column=1)
+        for day in range(1, 4):
+            self.upsert(other, f'2020-06-0{day}', day)
+
+        other.flush()
+        with self.assertRaises(sqlite3.OperationalError):
+            failing.flush()
+        # The rows of the other producer are written even if they shared a batch with the failing row
+        self.assertEqual(self.count_rows('epidemiology'), 3)
+
+    def test_write_behind(self):
+        adapter = SqliteHelper(sqlite_file_path=self.sqlite_file_path, bulk=True)
+        adapter.start_write_behind(queue_size=2)
+        for day in range(1, 10):
+            self.upsert(adapter, f'2020-05-0{day}', day)
+        adapter.flush()
+
+        self.assertEqual(self.count_rows('epidemiology'), 9)
+        self.assertEqual(adapter.get_latest_timestamp('epidemiology', 'GBR_PHE'), '2020-05-09')
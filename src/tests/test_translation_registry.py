@@ -0,0 +1,38 @@
+import os
+import unittest
+import tempfile
+
+from utils.translation_registry import TranslationRegistry
+
+translation_csv = """\
+input_adm_area_1,input_adm_area_2,input_adm_area_3,adm_area_1,adm_area_2,adm_area_3,gid
+england,,,England,,,GBR.1_1
+"""
+
+
+class TranslationRegistryTestCase(unittest.TestCase):
+
+    def test_reload_on_change(self):
+        registry = TranslationRegistry()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_fname = os.path.join(tmp_dir, 'translation.csv')
+            with open(csv_fname, 'w') as f:
+                f.write(translation_csv)
+
+            translator = registry.adm_translator(csv_fname)
+            translator.tr('GBR', 'England')
+            self.assertIs(registry.adm_translator(csv_fname), translator)
+            self.assertIn(('GBR', 'England', None, None), translator.cache)
+
+            with open(csv_fname, 'a') as f:
+                f.write('wales,,,Wales,,,GBR.4_1\n')
+            stat = os.stat(csv_fname)
+            os.utime(csv_fname, (stat.st_atime, stat.st_mtime + 1))
+
+            reloaded = registry.adm_translator(csv_fname)
+            self.assertIsNot(reloaded, translator)
+            self.assertEqual(reloaded.tr('GBR', 'Wales')[-1], ['GBR.4_1'])
+
+    def test_country_codes_translator_is_shared(self):
+        registry = TranslationRegistry()
+        self.assertIs(registry.country_codes_translator(), registry.country_codes_translator())
@@ -0,0 +1,61 @@
+import os
+import unittest
+import tempfile
+import pandas as pd
+
+from utils.types import FetcherType
+from adapters.sqlite import SqliteHelper
+from adapters.csvfile import CSVFileHelper
+from adapters.memory import MemoryHelper
+
+
+def epidemiology_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        'source': 'GBR_PHE',
+        'date': ['2020-05-01', '2020-05-01', '2020-05-02'],
+        'country': 'United Kingdom',
+        'countrycode': 'GBR',
+        'adm_area_1': ['England', 'Wales', 'England'],
+        'gid': [['GBR.1_1'], None, ['GBR.1_1']],
+        'confirmed': [10.0, 3.0, None]
+    })
+
+
+class UpsertFrameTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_sqlite(self):
+        adapter = SqliteHelper(sqlite_file_path=os.path.join(self.tmp_dir.name, 'covid19.sqlite'))
+        adapter.upsert_frame(FetcherType.EPIDEMIOLOGY, epidemiology_frame())
+
+        result = adapter.execute('SELECT date, adm_area_1, adm_area_2, gid, confirmed FROM epidemiology '
+                                 'ORDER BY date, adm_area_1')
+        self.assertEqual(result, [('2020-05-01', 'England', '', 'GBR.1_1', 10),
+                                  ('2020-05-01', 'Wales', '', None, 3),
+                                  ('2020-05-02', 'England', '', 'GBR.1_1', None)])
+        self.assertIn(('GBR_PHE', 'GBR', 'Wales', None, None), adapter.MISSING_GIDS)
+
+    def test_csv(self):
+        adapter = CSVFileHelper(csv_path=self.tmp_dir.name)
+        adapter.upsert_frame(FetcherType.EPIDEMIOLOGY, epidemiology_frame())
+        adapter.flush()
+
+        df = pd.read_csv(os.path.join(self.tmp_dir.name, 'epidemiology_GBR_PHE.csv'))
+        self.assertEqual(list(df.date), ['2020-05-01', '2020-05-01', '2020-05-02'])
+        self.assertEqual(list(df.gid.fillna('')), ['GBR.1_1', '', 'GBR.1_1'])
+
+    def test_memory_fallback_matches_upsert_data(self):
+        adapter = MemoryHelper()
+        adapter.upsert_frame(FetcherType.EPIDEMIOLOGY, epidemiology_frame())
+        self.assertEqual(adapter.stats[('epidemiology', 'GBR_PHE')]['rows'], 3)
+        self.assertEqual(adapter.get_adm_division('GBR', 'england')[-1], ['GBR.1_1'])
+
+    def test_invalid_columns(self):
+        df = epidemiology_frame().drop(columns=['countrycode']).assign(deaths=1)
+        with self.assertRaises(ValueError):
+            MemoryHelper().upsert_frame(FetcherType.EPIDEMIOLOGY, df)
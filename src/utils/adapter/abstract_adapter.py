@@ -13,11 +13,16 @@
 # limitations under the License.
 
 import logging
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Tuple
+from datetime import date, datetime
 from utils.types import FetcherType
 from abc import ABC, abstractmethod
+import pandas as pd
 from utils.config import config
+from utils.schema import get_schema
+from utils.adapter.background_writer import BackgroundWriter
+from utils.adapter.fingerprint_cache import FingerprintCache
+from utils.administrative_division_translator.fuzzy_matcher import FuzzyMatcher
 
 __all__ = ('AbstractAdapter',)
 
@@ -26,10 +31,26 @@ logger = logging.getLogger(__name__)
 
 class AbstractAdapter(ABC):
     MISSING_GIDS = set()
+    # Reads can run while another thread writes, e.g. the connection is guarded by a lock
+    thread_safe_reads = False
+    write_behind = None
+    fingerprints = None
+    sliding_windows = None
+    revisions = None
+    fuzzy_matchers = None
 
-    @staticmethod
-    def date_in_window(args: Dict) -> bool:
-        if not config.SLIDING_WINDOW_DAYS:
+    def set_sliding_window(self, source: str, days: int):
+        # Overrides SLIDING_WINDOW_DAYS for the rows of one source
+        if self.sliding_windows is None:
+            self.sliding_windows = dict()
+        self.sliding_windows[source] = days
+
+    def get_sliding_window(self, source: str) -> int:
+        return (self.sliding_windows or {}).get(source, config.SLIDING_WINDOW_DAYS)
+
+    def date_in_window(self, args: Dict) -> bool:
+        sliding_window_days = self.get_sliding_window(args.get('source'))
+        if not sliding_window_days:
             return True
 
         date = args.get('date')
@@ -38,11 +59,32 @@ class AbstractAdapter(ABC):
 
         if isinstance(date, datetime):
             days = (datetime.now() - date).days
-            if days > config.SLIDING_WINDOW_DAYS:
+            if days > sliding_window_days:
                 return False
 
         return True
 
+    def count_revision(self, source: str, revised_date):
+        # Remembers the oldest date of a row whose stored values changed, see pop_revision()
+        if isinstance(revised_date, str):
+            revised_date = datetime.strptime(revised_date.split(' ')[0].split('T')[0], '%Y-%m-%d').date()
+        elif isinstance(revised_date, datetime):
+            revised_date = revised_date.date()
+        if not isinstance(revised_date, date):
+            return
+        if self.revisions is None:
+            self.revisions = dict()
+        if source not in self.revisions or revised_date < self.revisions[source]:
+            self.revisions[source] = revised_date
+
+    def tracks_revisions(self, table_name: str) -> bool:
+        # Whether count_revision() sees the stored rows of the table change, needed by the adaptive sliding window
+        return bool(self.fingerprints) and not table_name.startswith('staging_')
+
+    def pop_revision(self, source: str) -> date:
+        # The oldest date revised by the source since the last call, None if it only added rows
+        return (self.revisions or {}).pop(source, None)
+
     @staticmethod
     def correct_table_name(table_name: str) -> str:
         if config.VALIDATE_INPUT_DATA and table_name in ['epidemiology']:
@@ -67,6 +109,23 @@ class AbstractAdapter(ABC):
                          adm_area_3: str = None):
         raise NotImplementedError()
 
+    def get_adm_divisions(self, countrycode: str) -> List[Tuple]:
+        # All administrative divisions of a country, as returned by get_adm_division(), none if not supported
+        return []
+
+    def reset_adm_division_cache(self):
+        self.fuzzy_matchers = dict()
+
+    def fuzzy_match_adm_division(self, countrycode: str, adm_area_1: str = None, adm_area_2: str = None,
+                                 adm_area_3: str = None) -> Tuple:
+        # Last resort for areas get_adm_division() can't find, None if no division is close enough
+        if self.fuzzy_matchers is None:
+            self.fuzzy_matchers = dict()
+        if countrycode not in self.fuzzy_matchers:
+            self.fuzzy_matchers[countrycode] = FuzzyMatcher(self.get_adm_divisions(countrycode),
+                                                            threshold=config.FUZZY_MATCH_THRESHOLD)
+        return self.fuzzy_matchers[countrycode].match(adm_area_1, adm_area_2, adm_area_3)
+
     def check_if_gid_exists(self, kwargs: List) -> bool:
         if not kwargs.get('gid') and not kwargs.get('msoa'):
             missing = kwargs.get("source"), kwargs.get("countrycode"), kwargs.get("adm_area_1"), kwargs.get(
@@ -74,22 +133,91 @@ class AbstractAdapter(ABC):
             if missing not in self.MISSING_GIDS:
                 self.MISSING_GIDS.add(missing)
 
+    def reset_upsert_stats(self):
+        self.upsert_stats = {'changed': 0, 'unchanged': 0}
+
+    def count_upsert(self, changed: bool, count: int = 1):
+        if not hasattr(self, 'upsert_stats'):
+            self.reset_upsert_stats()
+        self.upsert_stats['changed' if changed else 'unchanged'] += count
+
+    def publish_upsert_stats(self, source: str):
+        stats = getattr(self, 'upsert_stats', None)
+        if stats and any(stats.values()):
+            logger.info(f"Upserted rows for {source}: {stats['changed']} changed, {stats['unchanged']} unchanged")
+
     def publish_missing_gids(self):
         if self.MISSING_GIDS:
             for gid in self.MISSING_GIDS:
                 logger.warning(f'GID is missing for: {gid}, please correct your data')
 
-    def upsert_data(self, fetcher_type: FetcherType, **kwargs):
+    def start_write_behind(self, queue_size: int = 10000):
+        # Upserts are queued and written by a background thread, so fetchers parse while the adapter writes.
+        # put() blocks while the queue is full and re-raises the errors of earlier writes.
+        if not self.write_behind:
+            self.write_behind = BackgroundWriter(self.write_records, maxsize=queue_size,
+                                                 name=f'write-behind-{type(self).__name__}')
+
+    def fingerprint_target(self) -> str:
+        # Identifies where the adapter writes to, None if it rewrites its output with the rows of a run only
+        return None
+
+    def use_fingerprint_cache(self, cache_file_path: str):
+        target = self.fingerprint_target()
+        if not target:
+            logger.warning(f'{type(self).__name__} does not keep rows of earlier runs, fingerprint cache disabled')
+            return
+        self.fingerprints = FingerprintCache(cache_file_path, target)
+
+    def is_unchanged(self, fetcher_type: FetcherType, kwargs: Dict) -> bool:
+        # Staging tables are truncated before every run and validated as a whole, so they get every row
+        table_name = self.correct_table_name(fetcher_type.value)
+        if not self.fingerprints or table_name.startswith('staging_'):
+            return False
+        changed = self.fingerprints.compare(table_name, kwargs)
+        if changed:
+            self.count_revision(kwargs.get('source'), kwargs.get('date'))
+        if changed is not False:
+            return False
+        self.count_upsert(changed=False)
+        return True
+
+    def count_revision_outside_window(self, fetcher_type: FetcherType, kwargs: Dict):
+        # Rows older than the sliding window aren't written, their revisions are still counted
+        # so that an adaptive window can grow back to cover them
+        table_name = self.correct_table_name(fetcher_type.value)
+        if self.fingerprints and not table_name.startswith('staging_') \
+                and self.fingerprints.is_revised(table_name, kwargs):
+            self.count_revision(kwargs.get('source'), kwargs.get('date'))
+
+    def skip_row(self, fetcher_type: FetcherType, kwargs: Dict) -> bool:
         if not self.date_in_window(kwargs):
+            self.count_revision_outside_window(fetcher_type, kwargs)
+            return True
+        return self.is_unchanged(fetcher_type, kwargs)
+
+    def write_records(self, records: List):
+        for fetcher_type, data in records:
+            if isinstance(data, pd.DataFrame):
+                self.write_frame(fetcher_type, data)
+            else:
+                self.write_data(fetcher_type, **data)
+
+    def upsert_data(self, fetcher_type: FetcherType, **kwargs):
+        if self.skip_row(fetcher_type, kwargs):
             return
 
+        if self.write_behind:
+            return self.write_behind.put((fetcher_type, kwargs))
+        return self.write_data(fetcher_type, **kwargs)
+
+    def write_data(self, fetcher_type: FetcherType, **kwargs):
         table_name = self.correct_table_name(fetcher_type.value)
 
         if fetcher_type == FetcherType.EPIDEMIOLOGY:
             return self.upsert_epidemiology_data(table_name, **kwargs)
         elif fetcher_type == FetcherType.EPIDEMIOLOGY_MSOA:
-            data_keys = ['msoa', 'msoa_code', 'confirmed', 'dead', 'population']
-            return self.upsert_epidemiology_data(table_name, data_keys, **kwargs)
+            return self.upsert_epidemiology_data(table_name, **kwargs)
         elif fetcher_type == FetcherType.MOBILITY:
             return self.upsert_mobility_data(table_name, **kwargs)
         elif fetcher_type == FetcherType.GOVERNMENT_RESPONSE:
@@ -99,9 +227,83 @@ class AbstractAdapter(ABC):
         else:
             raise NotImplementedError()
 
+    @staticmethod
+    def frame_records(df: pd.DataFrame) -> List[Dict]:
+        # Python values with None for missing ones, as the fetchers pass them to upsert_data()
+        return df.astype(object).where(df.notna(), None).to_dict('records')
+
+    @staticmethod
+    def format_frame(df: pd.DataFrame, gid_separator: str = ':') -> pd.DataFrame:
+        # Dates as YYYY-MM-DD and gids joined, as written to files
+        df = df.assign(date=pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d'))
+        if 'gid' in df.columns:
+            df = df.assign(gid=df['gid'].map(
+                lambda gid: gid_separator.join(gid) if isinstance(gid, list) and gid else None))
+        return df
+
+    def check_frame_gids(self, df: pd.DataFrame):
+        if 'gid' in df.columns:
+            missing = df['gid'].map(lambda gid: not isinstance(gid, (list, str)) or not gid).astype(bool)
+        else:
+            missing = pd.Series(True, index=df.index)
+        if 'msoa' in df.columns:
+            missing &= df['msoa'].isna()
+
+        columns = ['source', 'countrycode', 'adm_area_1', 'adm_area_2', 'adm_area_3']
+        for row in self.frame_records(df.loc[missing].reindex(columns=columns).drop_duplicates()):
+            self.MISSING_GIDS.add(tuple(row.values()))
+
+    def prepare_frame(self, fetcher_type: FetcherType, df: pd.DataFrame) -> pd.DataFrame:
+        schema = get_schema(fetcher_type.value)
+        missing = [column for column in schema.not_null if column not in df.columns]
+        unknown = [column for column in df.columns if column not in schema.types]
+        if missing or unknown:
+            raise ValueError(f'Invalid columns for {fetcher_type.value}, missing: {missing}, unknown: {unknown}')
+
+        df = schema.coerce_frame(df.copy())
+        windows = df['source'].map({source: self.get_sliding_window(source)
+                                    for source in df['source'].unique()}).astype(float)
+        in_window = windows.isna() | ((pd.Timestamp.now() - df['date']).dt.days <= windows)
+        df['date'] = df['date'].dt.date
+        if self.fingerprints and not in_window.all():
+            for row in self.frame_records(df[~in_window]):
+                self.count_revision_outside_window(fetcher_type, row)
+        df = df[in_window]
+
+        table_name = self.correct_table_name(fetcher_type.value)
+        if self.fingerprints and not table_name.startswith('staging_') and len(df):
+            changed = []
+            for row in self.frame_records(df):
+                row_changed = self.fingerprints.compare(table_name, row)
+                if row_changed:
+                    self.count_revision(row['source'], row['date'])
+                changed.append(row_changed is not False)
+            self.count_upsert(changed=False, count=changed.count(False))
+            df = df[changed]
+        return df.reset_index(drop=True)
+
+    def upsert_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        # Validates and converts the columns once, then hands the whole frame to the adapter
+        df = self.prepare_frame(fetcher_type, df)
+        if df.empty:
+            return
+        self.check_frame_gids(df)
+
+        if self.write_behind:
+            return self.write_behind.put((fetcher_type, df))
+        return self.write_frame(fetcher_type, df)
+
+    def write_frame(self, fetcher_type: FetcherType, df: pd.DataFrame):
+        # Adapters without a bulk path write the rows one by one
+        for row in self.frame_records(df):
+            self.write_data(fetcher_type, **row)
+
     def get_data(self, table_name: str, source: str, date: str, gid: str):
         raise NotImplementedError()
 
+    def get_earliest_timestamp(self, table_name: str, source: str = None):
+        raise NotImplementedError()
+
     def get_latest_timestamp(self, table_name: str, source: str = None):
         raise NotImplementedError()
 
@@ -109,6 +311,19 @@ class AbstractAdapter(ABC):
         raise NotImplementedError()
 
     def flush(self):
+        try:
+            if self.write_behind:
+                self.write_behind.join()
+            self.flush_data()
+        except Exception:
+            if self.fingerprints:
+                self.fingerprints.discard()
+            raise
+        # Fingerprints are stored only once the rows are written
+        if self.fingerprints:
+            self.fingerprints.commit()
+
+    def flush_data(self):
         pass
 
     def call_db_function_compare(self, source_code: str) -> bool:
@@ -117,5 +332,5 @@ class AbstractAdapter(ABC):
     def call_db_function_send_data(self, source_code: str):
         pass
 
-    def truncate_staging(self):
+    def truncate_staging(self, source_code: str = None):
         pass
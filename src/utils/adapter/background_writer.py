@@ -0,0 +1,126 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import logging
+import threading
+from typing import Callable, List
+
+__all__ = ('BackgroundWriter',)
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+
+
+class WriterTask:
+    def __init__(self, fn: Callable, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.fn(*self.args, **self.kwargs)
+        except Exception as ex:
+            self.error = ex
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class BackgroundWriter:
+    """
+    Drains a bounded queue on a dedicated thread and hands the queued items to `handler` in batches.
+    put() blocks while the queue is full, errors raised by the handler are re-raised to the producer.
+    """
+
+    def __init__(self, handler: Callable[[List], None], maxsize: int = 10000, batch_size: int = 1000,
+                 name: str = None):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        self.raise_error()
+        self.queue.put(item)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> WriterTask:
+        # Runs fn on the writer thread once everything queued before it has been written
+        task = WriterTask(fn, args, kwargs)
+        if threading.current_thread() is self.thread:
+            task.run()
+        else:
+            self.queue.put(task)
+        return task
+
+    def call(self, fn: Callable, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).wait()
+
+    def join(self):
+        self.call(lambda: None)
+        self.raise_error()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error:
+            error, self.error = self.error, None
+            raise error
+
+    def write(self, batch: List):
+        if not batch:
+            return
+        try:
+            self.handler(batch)
+        except Exception as ex:
+            logger.error(f'Background writer {self.thread.name} failed to write {len(batch)} items: {ex}',
+                         exc_info=True)
+            self.error = self.error or ex
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = []
+            for item in items:
+                if item is STOP:
+                    self.write(batch)
+                    return
+                if isinstance(item, WriterTask):
+                    self.write(batch)
+                    batch = []
+                    item.run()
+                else:
+                    batch.append(item)
+            self.write(batch)
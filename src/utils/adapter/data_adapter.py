@@ -16,6 +16,9 @@ from utils.config import config
 from adapters.postgresql import PostgresqlHelper
 from adapters.sqlite import SqliteHelper
 from adapters.csvfile import CSVFileHelper
+from adapters.parquet import ParquetFileHelper
+from adapters.memory import MemoryHelper
+from adapters.fanout import FanOutHelper
 from utils.adapter.abstract_adapter import AbstractAdapter
 
 __all__ = ('DataAdapter')
@@ -24,16 +27,52 @@ __all__ = ('DataAdapter')
 class DataAdapter:
 
     @staticmethod
-    def get_adapter() -> AbstractAdapter:
-        if config.DB_USERNAME and config.DB_PASSWORD and config.DB_ADDRESS and config.DB_NAME:
+    def create_adapter(name: str) -> AbstractAdapter:
+        if name == 'memory':
+            # Profiling, keeps the rows in memory or only counts them with MEMORY=count
+            return MemoryHelper(keep_rows=config.MEMORY != 'count')
+        elif name == 'postgresql':
             return PostgresqlHelper(user=config.DB_USERNAME,
                                     password=config.DB_PASSWORD,
                                     host=config.DB_ADDRESS,
                                     port=config.DB_PORT,
                                     database_name=config.DB_NAME)
+        elif name == 'sqlite':
+            return SqliteHelper(sqlite_file_path=config.SQLITE,
+                                bulk=config.SQLITE_BULK,
+                                batch_size=config.SQLITE_BATCH_SIZE,
+                                single_writer=config.SQLITE_SINGLE_WRITER,
+                                queue_size=config.WRITER_QUEUE_SIZE)
+        elif name == 'csv':
+            return CSVFileHelper(csv_path=config.CSV, merge=config.CSV_MERGE)
+        elif name == 'parquet':
+            return ParquetFileHelper(parquet_path=config.PARQUET)
+        else:
+            raise ValueError(f'Unknown adapter: {name}')
+
+    @staticmethod
+    def select_adapter() -> AbstractAdapter:
+        if config.FANOUT_ADAPTERS:
+            adapters = [DataAdapter.create_adapter(name) for name in config.FANOUT_ADAPTERS]
+            return FanOutHelper(adapters, queue_size=config.WRITER_QUEUE_SIZE)
+        elif config.MEMORY:
+            return DataAdapter.create_adapter('memory')
+        elif config.DB_USERNAME and config.DB_PASSWORD and config.DB_ADDRESS and config.DB_NAME:
+            return DataAdapter.create_adapter('postgresql')
         elif config.SQLITE:
-            return SqliteHelper(sqlite_file_path=config.SQLITE)
+            return DataAdapter.create_adapter('sqlite')
         elif config.CSV:
-            return CSVFileHelper(csv_path=config.CSV)
+            return DataAdapter.create_adapter('csv')
+        elif config.PARQUET:
+            return DataAdapter.create_adapter('parquet')
         else:
             raise ValueError('Unable to select serializer')
+
+    @staticmethod
+    def get_adapter() -> AbstractAdapter:
+        adapter = DataAdapter.select_adapter()
+        if config.WRITE_BEHIND:
+            adapter.start_write_behind(queue_size=config.WRITER_QUEUE_SIZE)
+        if config.FINGERPRINT_CACHE:
+            adapter.use_fingerprint_cache(config.FINGERPRINT_CACHE)
+        return adapter
@@ -0,0 +1,118 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+from utils.schema import get_schema
+
+__all__ = ('FingerprintCache',)
+
+logger = logging.getLogger(__name__)
+
+sql_create_fingerprints_table = """
+    CREATE TABLE IF NOT EXISTS fingerprints (
+        target text NOT NULL,
+        table_name text NOT NULL,
+        source text NOT NULL,
+        row_key text NOT NULL,
+        fingerprint integer NOT NULL,
+        PRIMARY KEY (target, table_name, source, row_key)
+    ) WITHOUT ROWID
+"""
+
+
+def row_key(table_name: str, data: Dict) -> str:
+    # Upserts of the same row with other columns, e.g. confirmed and then dead, keep fingerprints of their own
+    key = get_schema(table_name).key
+    return json.dumps([data.get(column) for column in key] + sorted(column for column in data if column not in key),
+                      default=str)
+
+
+def row_fingerprint(data: Dict) -> int:
+    digest = hashlib.blake2b(json.dumps(data, sort_keys=True, default=str).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class FingerprintCache:
+    """
+    Remembers a fingerprint of every row written by earlier runs, keyed by the adapter target (e.g. database or
+    path), table, source, primary key and upserted columns, in a local SQLite file. Rows whose fingerprint did not
+    change are not sent to the adapter again. New fingerprints are only stored by commit(), once the adapter has flushed the rows.
+    Delete the file to write every row again, e.g. after restoring the database.
+    """
+
+    def __init__(self, cache_file_path: str, target: str):
+        self.cache_file_path = cache_file_path
+        self.target = target
+        self.conn = sqlite3.connect(cache_file_path, check_same_thread=False)
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(fingerprints)')]
+        if columns and 'target' not in columns:
+            # Written by a version that didn't know the target, the rows could belong to any destination
+            self.conn.execute('DROP TABLE fingerprints')
+        self.conn.execute(sql_create_fingerprints_table)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.fingerprints = dict()
+        self.pending = dict()
+
+    def load(self, table_name: str, source: str) -> Dict:
+        if (table_name, source) not in self.fingerprints:
+            rows = self.conn.execute('SELECT row_key, fingerprint FROM fingerprints '
+                                     'WHERE target = ? AND table_name = ? AND source = ?',
+                                     (self.target, table_name, source)).fetchall()
+            self.fingerprints[(table_name, source)] = dict(rows)
+            logger.debug(f'Loaded {len(rows)} fingerprints for {table_name} {source}')
+        return self.fingerprints[(table_name, source)]
+
+    def compare(self, table_name: str, data: Dict) -> Optional[bool]:
+        # None for a row not seen before, True if its values changed since it was last written
+        source = data.get('source')
+        key = row_key(table_name, data)
+        fingerprint = row_fingerprint(data)
+        with self.lock:
+            previous = self.load(table_name, source).get(key)
+            if previous == fingerprint:
+                return False
+            self.pending[(table_name, source, key)] = fingerprint
+        return None if previous is None else True
+
+    def is_revised(self, table_name: str, data: Dict) -> bool:
+        # Like compare() for a row that is not written, its fingerprint is left as it is
+        with self.lock:
+            previous = self.load(table_name, data.get('source')).get(row_key(table_name, data))
+        return previous is not None and previous != row_fingerprint(data)
+
+    def changed(self, table_name: str, data: Dict) -> bool:
+        return self.compare(table_name, data) is not False
+
+    def commit(self):
+        with self.lock:
+            if not self.pending:
+                return
+            self.conn.executemany('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)',
+                                  [(self.target,) + key + (fingerprint,) for key, fingerprint in self.pending.items()])
+            self.conn.commit()
+            for (table_name, source, key), fingerprint in self.pending.items():
+                self.load(table_name, source)[key] = fingerprint
+            logger.debug(f'Stored {len(self.pending)} fingerprints')
+            self.pending = dict()
+
+    def discard(self):
+        with self.lock:
+            self.pending = dict()
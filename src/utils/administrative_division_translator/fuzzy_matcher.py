@@ -0,0 +1,93 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import logging
+import unicodedata
+from collections import Counter, defaultdict
+from typing import List, Set, Tuple
+from fuzzywuzzy import fuzz
+
+__all__ = ('FuzzyMatcher',)
+
+logger = logging.getLogger(__name__)
+
+
+def fuzzy_name(areas: Tuple) -> str:
+    # Areas joined and compared without accents, case and punctuation
+    name = ' '.join(area for area in areas if isinstance(area, str) and area)
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', name.lower()).split())
+
+
+def adm_level(areas: Tuple) -> int:
+    return max((level for level, area in enumerate(areas, 1) if isinstance(area, str) and area), default=0)
+
+
+def trigrams(name: str) -> Set[str]:
+    padded = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyMatcher:
+    """
+    Matches names of administrative divisions of one country that could not be translated otherwise.
+    A name is scored only against the divisions of the same level sharing the most trigrams with it,
+    so a lookup takes a bounded number of comparisons however many divisions the country has.
+    """
+
+    def __init__(self, divisions: List[Tuple], threshold: int = 90, max_candidates: int = 20):
+        # divisions as returned by get_adm_division(): country, adm_area_1, adm_area_2, adm_area_3, gid
+        self.divisions = divisions
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.names = [fuzzy_name(division[1:4]) for division in divisions]
+        self.index = defaultdict(lambda: defaultdict(list))
+        for position, division in enumerate(divisions):
+            for trigram in trigrams(self.names[position]):
+                self.index[adm_level(division[1:4])][trigram].append(position)
+        self.cache = dict()
+
+    def candidates(self, name: str, level: int) -> List[int]:
+        counts = Counter()
+        level_index = self.index.get(level, {})
+        for trigram in trigrams(name):
+            counts.update(level_index.get(trigram, ()))
+        return [position for position, _ in counts.most_common(self.max_candidates)]
+
+    def match(self, adm_area_1: str = None, adm_area_2: str = None, adm_area_3: str = None) -> Tuple:
+        areas = (adm_area_1, adm_area_2, adm_area_3)
+        if areas not in self.cache:
+            self.cache[areas] = self.find(areas)
+        return self.cache[areas]
+
+    def find(self, areas: Tuple) -> Tuple:
+        name = fuzzy_name(areas)
+        if not name:
+            return None
+
+        scores = sorted(((fuzz.ratio(name, self.names[position]), position)
+                         for position in self.candidates(name, adm_level(areas))), reverse=True)
+        if not scores or scores[0][0] < self.threshold:
+            return None
+
+        best_score, best = scores[0]
+        # Two different divisions scoring the same are left to be fixed by hand
+        if any(score == best_score and self.divisions[position][-1] != self.divisions[best][-1]
+               for score, position in scores[1:]):
+            logger.debug(f'Ambiguous fuzzy match for {areas}')
+            return None
+
+        logger.info(f'Fuzzy matched {areas} to {self.divisions[best][1:]} with a score of {best_score}')
+        return self.divisions[best]
@@ -13,27 +13,40 @@
 # limitations under the License.
 
 import os
+import csv
 import logging
+import threading
 import pandas as pd
 from pandas import DataFrame
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 
 logger = logging.getLogger(__name__)
 
 
-def area_compare(data1, data2):
-    if data1 == data2:
-        return True
+def normalize_area(data):
+    # Areas are compared ignoring case and spaces
+    return data.lower().replace(" ", "") if isinstance(data, str) else data
 
-    if isinstance(data1, str) and isinstance(data2, str):
-        return data1.lower().replace(" ", '') == data2.lower().replace(" ", "")
 
-    return False
+MATCH_COLUMNS = ['countrycode', 'input_adm_area_1', 'input_adm_area_2', 'input_adm_area_3',
+                 'adm_area_1', 'adm_area_2', 'adm_area_3', 'gid']
+
+
+def matches_csv_fname(csv_fname: str) -> str:
+    # Translations added at run time are appended next to the translation file, e.g. translation_matches.csv
+    return f'{os.path.splitext(csv_fname)[0]}_matches.csv'
 
 
 class AdmTranslator:
-    def __init__(self, csv_fname: str):
+    def __init__(self, csv_fname: str, matches_csv_fname: str = None):
         self.translation_pd = self.load_translation_csv(csv_fname)
+        self.index = self.build_index(self.translation_pd)
+        # Matches accepted by earlier runs come after the translation file, which can override them
+        self.matches_csv_fname = matches_csv_fname
+        if matches_csv_fname:
+            for key, rows in self.build_index(self.load_translation_csv(matches_csv_fname)).items():
+                self.index.setdefault(key, []).extend(rows)
+        self.lock = threading.Lock()
         self.cache = dict()
 
     def load_translation_csv(self, csv_fname) -> DataFrame:
@@ -47,26 +60,61 @@ class AdmTranslator:
             return None
         translation_pd = pd.read_csv(csv_fname)
         translation_pd.columns = colnames_1 if len(translation_pd.columns) == len(colnames_1) else colnames_2
-        translation_pd = translation_pd.where((pd.notnull(translation_pd)), None)
+        # Empty columns are read as float, NaN has to become None there too
+        translation_pd = translation_pd.astype(object).where((pd.notnull(translation_pd)), None)
         return translation_pd
 
+    @staticmethod
+    def build_index(translation_pd: DataFrame) -> Dict:
+        # Rows by their normalized input areas, in the order of the CSV as the first matching row wins
+        index = dict()
+        if translation_pd is None:
+            return index
+        for row in translation_pd.itertuples(index=False):
+            key = (normalize_area(row.input_adm_area_1), normalize_area(row.input_adm_area_2),
+                   normalize_area(row.input_adm_area_3))
+            index.setdefault(key, []).append(row)
+        return index
+
+    def find_row(self, country_code: str, input_adm_area_1: str, input_adm_area_2: str, input_adm_area_3: str):
+        key = (normalize_area(input_adm_area_1), normalize_area(input_adm_area_2), normalize_area(input_adm_area_3))
+        for row in self.index.get(key, []):
+            if hasattr(row, 'countrycode') and country_code and row.countrycode != country_code:
+                continue
+            return row
+        return None
+
+    def add(self, country_code: str, input_adm_area_1: str, input_adm_area_2: str, input_adm_area_3: str,
+            adm_area_1: str, adm_area_2: str, adm_area_3: str, gid: List):
+        # Translations found elsewhere, e.g. by fuzzy matching, are returned by tr() from then on
+        # and appended to the matches file, to be reviewed and used by the next runs
+        key = (country_code, input_adm_area_1, input_adm_area_2, input_adm_area_3)
+        self.cache[key] = True, adm_area_1, adm_area_2, adm_area_3, gid
+        if not self.matches_csv_fname:
+            return
+        with self.lock:
+            write_header = not os.path.exists(self.matches_csv_fname)
+            with open(self.matches_csv_fname, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(MATCH_COLUMNS)
+                writer.writerow([country_code, input_adm_area_1, input_adm_area_2, input_adm_area_3,
+                                 adm_area_1, adm_area_2, adm_area_3, ':'.join(gid) if gid else None])
+        logger.info(f'Translation of {key[1:]} appended to {self.matches_csv_fname}')
+
     def tr(self, country_code: str = None, input_adm_area_1: str = None, input_adm_area_2: str = None,
            input_adm_area_3: str = None, return_original_if_failure: bool = False,
            suppress_exception: bool = False) -> Tuple[bool, str, str, str, List]:
 
         key = (country_code, input_adm_area_1, input_adm_area_2, input_adm_area_3)
 
+        # Areas that can't be translated are cached as None
         if key in self.cache:
-            return self.cache.get(key)
-
-        for index, row in self.translation_pd.iterrows():
-            if area_compare(row.input_adm_area_1, input_adm_area_1) \
-                    and area_compare(row.input_adm_area_2, input_adm_area_2) \
-                    and area_compare(row.input_adm_area_3, input_adm_area_3):
-
-                if hasattr(row, 'countrycode') and country_code and row.countrycode != country_code:
-                    continue
-
+            result = self.cache.get(key)
+        else:
+            result = None
+            row = self.find_row(country_code, input_adm_area_1, input_adm_area_2, input_adm_area_3)
+            if row is not None:
                 if row.gid is None:
                     message = f'Unable to get GID for: {row.adm_area_1}, {row.adm_area_2}, {row.adm_area_3}'
                     if not suppress_exception:
@@ -77,10 +125,11 @@ class AdmTranslator:
                 gid = row.gid.split(':') if row.gid else None
                 result = True, row.adm_area_1, row.adm_area_2, row.adm_area_3, gid
 
-                # Cache result
-                self.cache[key] = result
-                return result
+            # Cache result
+            self.cache[key] = result
 
+        if result:
+            return result
         if return_original_if_failure:
             return False, input_adm_area_1, input_adm_area_2, input_adm_area_3, None
         else:
@@ -57,8 +57,30 @@ class Config:
         self.load_env_variable("DB_ADDRESS")
         self.load_env_variable("DB_NAME")
         self.load_env_variable("DB_PORT", 5432, fun=lambda x: int(x))
+        self.load_env_variable("DB_MANAGE_SCHEMA", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("DB_PARTITION_BY_DATE", "", fun=lambda x: x.lower() == 'true')
         self.load_env_variable("SQLITE")
+        self.load_env_variable("SQLITE_BULK", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("SQLITE_BATCH_SIZE", 5000, fun=lambda x: int(x))
+        self.load_env_variable("SQLITE_SINGLE_WRITER", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("WRITER_QUEUE_SIZE", 10000, fun=lambda x: int(x))
+        self.load_env_variable("WRITE_BEHIND", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("FINGERPRINT_CACHE")
+        self.load_env_variable("RECORD_BATCH_SIZE", 5000, fun=lambda x: int(x))
+        self.load_env_variable("INCREMENTAL_FETCH", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("FETCH_STATE", "fetch_state.json")
+        self.load_env_variable("ADAPTIVE_SLIDING_WINDOW", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("ADAPTIVE_SLIDING_WINDOW_RUNS", 10, fun=lambda x: int(x))
+        self.load_env_variable("SLIDING_WINDOW_MARGIN_DAYS", 3, fun=lambda x: int(x))
+        self.load_env_variable("FUZZY_MATCH", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("FUZZY_MATCH_THRESHOLD", 90, fun=lambda x: int(x))
         self.load_env_variable("CSV")
+        self.load_env_variable("CSV_MERGE", "", fun=lambda x: x.lower() == 'true')
+        self.load_env_variable("PARQUET")
+        # true (or store) keeps the rows, count only counts them, anything else disables the adapter
+        self.load_env_variable("MEMORY", "", fun=lambda x: x.lower() if x.lower() in ('true', 'store', 'count') else '')
+        self.load_env_variable("FANOUT_ADAPTERS", "",
+                               fun=lambda x: [name.strip().lower() for name in x.split(',') if name.strip()])
 
 
 config = Config()
@@ -16,14 +16,26 @@ import os
 import logging
 import pandas as pd
 from pandas import DataFrame
-from typing import Tuple, List
+from typing import Dict, Tuple
 
 logger = logging.getLogger(__name__)
 
+TRANSLATION_CSV = os.path.join(os.path.dirname(__file__), 'wikipedia-iso-country-codes.csv')
+
+
+ALPHA_2 = 'alpha-2'
+ALPHA_3 = 'alpha-3'
+NAME = 'name'
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(name.split()).casefold()
+
 
 class CountryCodesTranslator:
     def __init__(self):
         self.translation_pd = self.load_translation_csv()
+        self.indexes = self.build_indexes(self.translation_pd)
 
     def load_translation_csv(self) -> DataFrame:
 
@@ -33,23 +45,44 @@ class CountryCodesTranslator:
 
         :return: [pandas DataFrame] ISO country codes.
         """
-        translation_csv_fname = 'wikipedia-iso-country-codes.csv'
-        path = os.path.dirname(__file__)
-        return pd.read_csv(os.path.join(path, translation_csv_fname))
-
-    def get_country_info(self, country_a2_code: str = None, country_name: str = None) -> Tuple:
-        try:
-            if country_a2_code and pd.notna(country_a2_code):
-                country_info = \
-                    self.translation_pd[self.translation_pd['Alpha-2 code'] == country_a2_code].to_dict('records')[0]
-            else:
-                country_info = \
-                    self.translation_pd[self.translation_pd['English short name lower case'] == country_name].to_dict(
-                        'records')[0]
-
-            countrycode = country_info["Alpha-3 code"]
-            country = country_info["English short name lower case"]
-        except Exception as ex:
-            return None, None
-
-        return country, countrycode
+        # Without the default NA values, as NA is the alpha-2 code of Namibia
+        return pd.read_csv(TRANSLATION_CSV, dtype=str, keep_default_na=False)
+
+    @staticmethod
+    def build_indexes(translation_pd: DataFrame) -> Dict[str, Dict]:
+        # (country, alpha-3 code) by alpha-2 code, alpha-3 code and normalized name, the first row of a key wins
+        indexes = {ALPHA_2: dict(), ALPHA_3: dict(), NAME: dict()}
+        for row in translation_pd.itertuples(index=False):
+            country, country_a2_code, countrycode = row[0], row[1], row[2]
+            info = (country, countrycode)
+            for code_type, key in [(ALPHA_2, country_a2_code), (ALPHA_3, countrycode), (NAME, normalize_name(country))]:
+                if key:
+                    indexes[code_type].setdefault(key, info)
+        return indexes
+
+    def get_country_info(self, country_a2_code: str = None, country_name: str = None,
+                         country_a3_code: str = None) -> Tuple:
+        if isinstance(country_a2_code, str) and country_a2_code:
+            return self.indexes[ALPHA_2].get(country_a2_code, (None, None))
+        if isinstance(country_a3_code, str) and country_a3_code:
+            return self.indexes[ALPHA_3].get(country_a3_code, (None, None))
+        if isinstance(country_name, str):
+            return self.indexes[NAME].get(normalize_name(country_name), (None, None))
+        return None, None
+
+    def translate_series(self, values: pd.Series, code_type: str = ALPHA_2) -> DataFrame:
+        """
+        Translates a whole column of alpha-2 codes, alpha-3 codes or country names at once.
+
+        :return: [pandas DataFrame] country and countrycode columns with the index of values, None if not found.
+        """
+        if code_type not in self.indexes:
+            raise ValueError(f'Unknown code type: {code_type}')
+        keys = values.map(lambda value: normalize_name(value) if isinstance(value, str) else None) \
+            if code_type == NAME else values
+        info = keys.map(self.indexes[code_type])
+        found = info.notna()
+        return DataFrame({
+            'country': info.map(lambda value: value[0], na_action='ignore').astype(object).where(found, None),
+            'countrycode': info.map(lambda value: value[1], na_action='ignore').astype(object).where(found, None)
+        }, index=values.index)
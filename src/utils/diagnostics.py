@@ -1,3 +1,4 @@
+import logging
 import requests
 from datetime import datetime
 from utils.fetcher.abstract_fetcher import AbstractFetcher
@@ -5,6 +6,8 @@ from utils.config import config
 
 __all__ = ('Diagnostics',)
 
+logger = logging.getLogger(__name__)
+
 
 class Diagnostics:
 
@@ -12,9 +15,6 @@ class Diagnostics:
         self.fetcher_instance = fetcher_instance
 
     def update_diagnostics_info(self, validation: bool, error: bool, start_time, end_time):
-        if config.CSV:
-            return
-
         data = {
             "table_name": self.fetcher_instance.TYPE.value,
             "source": self.fetcher_instance.SOURCE,
@@ -22,15 +22,26 @@ class Diagnostics:
             "error": error,
             "last_run_start": datetime.fromtimestamp(start_time),
             "last_run_stop": datetime.fromtimestamp(end_time),
-            "first_timestamp": self.fetcher_instance.get_earliest_timestamp(),
-            "last_timestamp": self.fetcher_instance.get_latest_timestamp(),
-            "details": self.fetcher_instance.get_details()
+            "first_timestamp": self.read(self.fetcher_instance.get_earliest_timestamp),
+            "last_timestamp": self.read(self.fetcher_instance.get_latest_timestamp),
+            "details": self.read(self.fetcher_instance.get_details)
         }
+        # Adapters without diagnostics raise NotImplementedError, FanOutHelper skips them one by one
         data_adapter = self.fetcher_instance.data_adapter
-        data_adapter.upsert_diagnostics(**data)
+        try:
+            data_adapter.upsert_diagnostics(**data)
+        except NotImplementedError:
+            logger.debug(f'{type(data_adapter).__name__} does not store diagnostics')
 
         self.send_post_request(data)
 
+    @staticmethod
+    def read(fn):
+        try:
+            return fn()
+        except NotImplementedError:
+            return None
+
     @staticmethod
     def send_post_request(data):
         if not config.DIAGNOSTICS_URL:
@@ -0,0 +1,63 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import logging
+import threading
+from typing import Dict
+
+__all__ = ('FetchState', 'get_fetch_state')
+
+logger = logging.getLogger(__name__)
+
+
+class FetchState:
+    """
+    Per source state of the fetchers kept between runs in a JSON file, e.g. the last date fetched.
+    """
+
+    def __init__(self, state_file_path: str):
+        self.state_file_path = state_file_path
+        self.lock = threading.Lock()
+        self.state = dict()
+        if os.path.exists(state_file_path):
+            with open(state_file_path, encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def get(self, source: str) -> Dict:
+        with self.lock:
+            return dict(self.state.get(source, {}))
+
+    def update(self, source: str, **values):
+        with self.lock:
+            self.state.setdefault(source, {}).update(values)
+            # Written next to the state file and renamed, so an interrupted run can't corrupt it
+            tmp_file_path = self.state_file_path + '.tmp'
+            with open(tmp_file_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=2, sort_keys=True, default=str)
+            os.replace(tmp_file_path, self.state_file_path)
+        logger.debug(f'Fetch state of {source} updated: {values}')
+
+
+STATES = dict()
+STATES_LOCK = threading.Lock()
+
+
+def get_fetch_state(state_file_path: str) -> FetchState:
+    key = os.path.abspath(state_file_path)
+    with STATES_LOCK:
+        if key not in STATES:
+            STATES[key] = FetchState(state_file_path)
+        return STATES[key]
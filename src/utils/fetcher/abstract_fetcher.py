@@ -14,15 +14,22 @@
 
 import os
 import sys
-from datetime import datetime, timedelta
-from abc import ABC, abstractmethod
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, Tuple, Union
+from abc import ABC
+import pandas as pd
 
 __all__ = ('AbstractFetcher')
 
+logger = logging.getLogger(__name__)
+
 from utils.config import config
 from utils.types import FetcherType
+from utils.schema import get_schema
+from utils.fetch_state import get_fetch_state
 from utils.adapter.abstract_adapter import AbstractAdapter
-from utils.country_codes_translator.translator import CountryCodesTranslator
+from utils.translation_registry import translation_registry
 from utils.administrative_division_translator.translator import AdmTranslator
 
 
@@ -32,9 +39,42 @@ class AbstractFetcher(ABC):
 
     def __init__(self, data_adapter: AbstractAdapter):
         self.adm_translator = self.load_adm_translator()
-        self.country_codes_translator = CountryCodesTranslator()
-        self.sliding_window_days = config.SLIDING_WINDOW_DAYS
+        self.country_codes_translator = translation_registry.country_codes_translator()
         self.data_adapter = data_adapter
+        self.adaptive_sliding_window = False
+        self.full_depth_probe = False
+        self.sliding_window_days = self.get_sliding_window_days()
+        self.fetched_until = None
+
+    def get_sliding_window_days(self) -> int:
+        # With ADAPTIVE_SLIDING_WINDOW the window covers the oldest revision seen by the last runs of the source,
+        # never less than SLIDING_WINDOW_DAYS
+        if not config.ADAPTIVE_SLIDING_WINDOW or not config.FETCH_STATE:
+            return config.SLIDING_WINDOW_DAYS
+        table_name = self.data_adapter.correct_table_name(self.TYPE.value)
+        if not self.data_adapter.tracks_revisions(table_name):
+            # The depth of revisions would always be 0 and the window would shrink to the margin
+            logger.warning(f'{self.SOURCE}: {type(self.data_adapter).__name__} does not track revisions of '
+                           f'{table_name}, adaptive sliding window disabled')
+            return config.SLIDING_WINDOW_DAYS
+        self.adaptive_sliding_window = True
+        state = get_fetch_state(config.FETCH_STATE).get(self.SOURCE)
+        revision_depths = state.get('revision_depths')
+        if not revision_depths:
+            return config.SLIDING_WINDOW_DAYS
+
+        if state.get('runs_since_probe', 0) >= config.ADAPTIVE_SLIDING_WINDOW_RUNS:
+            # Revisions older than the window are only fetched, and seen, by a run without window now and then
+            self.full_depth_probe = True
+            self.data_adapter.set_sliding_window(self.SOURCE, None)
+            logger.debug(f'{self.SOURCE}: fetching all dates to probe the depth of revisions')
+            return None
+
+        sliding_window_days = max(max(revision_depths) + config.SLIDING_WINDOW_MARGIN_DAYS,
+                                  config.SLIDING_WINDOW_DAYS or 0)
+        self.data_adapter.set_sliding_window(self.SOURCE, sliding_window_days)
+        logger.debug(f'{self.SOURCE}: sliding window of {sliding_window_days} days')
+        return sliding_window_days
 
     def get_first_date_to_fetch(self, initial_date: str) -> str:
         if self.sliding_window_days:
@@ -43,10 +83,66 @@ class AbstractFetcher(ABC):
             date_from = initial_date
         return date_from
 
+    @staticmethod
+    def to_date(value) -> date:
+        if isinstance(value, str):
+            return datetime.strptime(value.split(' ')[0].split('T')[0], '%Y-%m-%d').date()
+        if isinstance(value, datetime):
+            return value.date()
+        return value
+
+    def get_watermark(self) -> date:
+        # The last date fetched by a previous run, or the latest date stored for the source
+        if config.FETCH_STATE:
+            fetched_until = get_fetch_state(config.FETCH_STATE).get(self.SOURCE).get('fetched_until')
+            if fetched_until:
+                return self.to_date(fetched_until)
+        try:
+            return self.to_date(self.get_latest_timestamp())
+        except NotImplementedError:
+            return None
+
+    def get_date_range_to_fetch(self, initial_date: str) -> Tuple[date, date]:
+        date_to = date.today()
+        date_from = self.to_date(self.get_first_date_to_fetch(initial_date))
+
+        if config.INCREMENTAL_FETCH and not self.full_depth_probe:
+            watermark = self.get_watermark()
+            if watermark:
+                # The last date fetched is fetched again, sources often complete it later.
+                # With a sliding window the whole window is fetched, or more after a gap.
+                window_from = date_from if self.sliding_window_days else date_to
+                date_from = max(self.to_date(initial_date), min(watermark, window_from))
+
+        date_from = min(date_from, date_to)
+        self.fetched_until = date_to
+        logger.debug(f'{self.SOURCE}: fetching from {date_from} to {date_to}')
+        return date_from, date_to
+
+    def save_fetch_state(self):
+        # Called once the fetched data is written and validated
+        revised_from = self.data_adapter.pop_revision(self.SOURCE)
+        if not config.FETCH_STATE or not (config.INCREMENTAL_FETCH or self.adaptive_sliding_window):
+            return
+        fetch_state = get_fetch_state(config.FETCH_STATE)
+        state = fetch_state.get(self.SOURCE)
+        values = dict(last_run=datetime.now().isoformat(timespec='seconds'))
+        if self.fetched_until:
+            values['fetched_until'] = self.fetched_until.isoformat()
+
+        if self.adaptive_sliding_window:
+            # How many days back the source changed rows already stored, 0 if it only added rows
+            revision_depth = (date.today() - revised_from).days if revised_from else 0
+            revision_depths = state.get('revision_depths', []) + [revision_depth]
+            values['revision_depths'] = revision_depths[-config.ADAPTIVE_SLIDING_WINDOW_RUNS:]
+            values['runs_since_probe'] = 0 if self.full_depth_probe else state.get('runs_since_probe', 0) + 1
+
+        fetch_state.update(self.SOURCE, **values)
+
     def load_adm_translator(self) -> AdmTranslator:
         translation_csv_fname = getattr(self.__class__, 'TRANSLATION_CSV', "translation.csv")
         path = os.path.dirname(sys.modules[self.__class__.__module__].__file__)
-        return AdmTranslator(os.path.join(path, translation_csv_fname))
+        return translation_registry.adm_translator(os.path.join(path, translation_csv_fname))
 
     def get_region(self, countrycode: str, input_adm_area_1: str = None, input_adm_area_2: str = None,
                    input_adm_area_3: str = None, suppress_exception: bool = False):
@@ -64,9 +160,43 @@ class AbstractFetcher(ABC):
                     countrycode, input_adm_area_1, input_adm_area_2, input_adm_area_3)
             except Exception as ex:
                 adm_area_1, adm_area_2, adm_area_3, gid = input_adm_area_1, input_adm_area_2, input_adm_area_3, None
+                if config.FUZZY_MATCH:
+                    adm_area_1, adm_area_2, adm_area_3, gid = self.fuzzy_match_region(
+                        countrycode, input_adm_area_1, input_adm_area_2, input_adm_area_3)
 
         return adm_area_1, adm_area_2, adm_area_3, gid
 
+    def get_regions(self, df: pd.DataFrame) -> pd.DataFrame:
+        # get_region() for the countrycode and adm_area columns of a whole frame, called once per distinct region.
+        # Returns a copy with the translated adm_area columns and a gid column.
+        area_columns = [column for column in ['adm_area_1', 'adm_area_2', 'adm_area_3'] if column in df.columns]
+        key_columns = ['countrycode'] + area_columns
+        keys = df[key_columns].astype(object).where(df[key_columns].notna(), None)
+        codes, regions = pd.factorize(pd.Series(list(keys.itertuples(index=False, name=None)), dtype=object))
+
+        resolved = pd.DataFrame(
+            [self.get_region(region[0], **dict(zip([f'input_{column}' for column in area_columns], region[1:])))
+             for region in regions],
+            columns=['adm_area_1', 'adm_area_2', 'adm_area_3', 'gid'], dtype=object)
+
+        df = df.copy()
+        for column in resolved.columns:
+            df[column] = pd.Series(resolved[column].take(codes).to_numpy(), index=df.index, dtype=object)
+        return df
+
+    def fuzzy_match_region(self, countrycode: str, input_adm_area_1: str = None, input_adm_area_2: str = None,
+                           input_adm_area_3: str = None):
+        division = self.data_adapter.fuzzy_match_adm_division(
+            countrycode, input_adm_area_1, input_adm_area_2, input_adm_area_3)
+        if not division:
+            return input_adm_area_1, input_adm_area_2, input_adm_area_3, None
+
+        country, adm_area_1, adm_area_2, adm_area_3, gid = division
+        # Translated without matching again by the fetchers sharing the translation file, and by later runs
+        self.adm_translator.add(countrycode, input_adm_area_1, input_adm_area_2, input_adm_area_3,
+                                adm_area_1, adm_area_2, adm_area_3, gid)
+        return adm_area_1, adm_area_2, adm_area_3, gid
+
     def get_earliest_timestamp(self):
         return None
 
@@ -76,6 +206,42 @@ class AbstractFetcher(ABC):
     def get_details(self):
         return None
 
-    @abstractmethod
-    def run(self):
+    def records(self) -> Iterator[Union[Dict, pd.DataFrame]]:
+        # Fetchers either write in run() or yield upsert objects or DataFrames here and leave the writing to run()
         raise NotImplementedError()
+
+    def record_key(self, record: Dict) -> tuple:
+        return tuple(tuple(value) if isinstance(value, list) else value
+                     for value in (record.get(column) for column in get_schema(self.TYPE.value).key))
+
+    def write_batch(self, batch: Dict):
+        # Records with the same columns become one frame, so missing columns are not written as nulls
+        frames = dict()
+        for record in batch.values():
+            frames.setdefault(tuple(sorted(record.keys())), []).append(record)
+        for records in frames.values():
+            self.upsert_frame(pd.DataFrame.from_records(records))
+
+    def run(self):
+        batch_size = config.RECORD_BATCH_SIZE
+        batch = dict()
+        count = 0
+        for record in self.records():
+            if isinstance(record, pd.DataFrame):
+                # Records yielded before the frame are written first, so that later values win
+                self.write_batch(batch)
+                batch = dict()
+                count += len(record)
+                self.upsert_frame(record if 'source' in record.columns else record.assign(source=self.SOURCE))
+                continue
+
+            count += 1
+            record.setdefault('source', self.SOURCE)
+            # Within a batch a later record of the same row replaces the values of an earlier one
+            batch.setdefault(self.record_key(record), dict()).update(record)
+            if len(batch) >= batch_size:
+                self.write_batch(batch)
+                batch = dict()
+
+        self.write_batch(batch)
+        logger.info(f'{self.SOURCE}: {count} records written')
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 
-from abc import abstractmethod
+import pandas as pd
 
 __all__ = ('BaseEpidemiologyFetcher')
 
@@ -28,6 +28,9 @@ class BaseEpidemiologyFetcher(AbstractFetcher):
     def upsert_data(self, **kwargs):
         self.data_adapter.upsert_data(self.TYPE, **kwargs)
 
+    def upsert_frame(self, df: pd.DataFrame):
+        self.data_adapter.upsert_frame(self.TYPE, df)
+
     def get_data(self, **kwargs):
         return self.data_adapter.get_data(self.TYPE.value, **kwargs)
 
@@ -39,7 +42,3 @@ class BaseEpidemiologyFetcher(AbstractFetcher):
 
     def get_details(self):
         return self.data_adapter.get_details(self.TYPE.value, self.SOURCE)
-
-    @abstractmethod
-    def run(self):
-        raise NotImplementedError()
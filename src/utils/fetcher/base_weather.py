@@ -13,7 +13,7 @@
 # limitations under the License.
 
 
-from abc import abstractmethod
+import pandas as pd
 
 __all__ = ('BaseWeatherFetcher')
 
@@ -28,12 +28,11 @@ class BaseWeatherFetcher(AbstractFetcher):
     def upsert_data(self, **kwargs):
         self.data_adapter.upsert_data(self.TYPE, **kwargs)
 
+    def upsert_frame(self, df: pd.DataFrame):
+        self.data_adapter.upsert_frame(self.TYPE, df)
+
     def get_earliest_timestamp(self):
         return self.data_adapter.get_earliest_timestamp(self.TYPE.value)
 
     def get_latest_timestamp(self):
         return self.data_adapter.get_latest_timestamp(self.TYPE.value)
-
-    @abstractmethod
-    def run(self):
-        raise NotImplementedError()
@@ -125,6 +125,8 @@ class Plugins:
     @timeit
     def run_plugins_job(self, data_adapter: AbstractAdapter):
         Diagnostics.send_post_request(data={"type": "jobs_start", "ts": time.time()})
+        # Administrative divisions may have changed since the last job
+        data_adapter.reset_adm_division_cache()
         for plugin in self.available_plugins:
             if self.should_run_plugin(plugin.__name__):
                 self.run_single_plugin(data_adapter, plugin)
@@ -139,17 +141,22 @@ class Plugins:
         start_time = time.time()
         try:
             if self.validate_input_data:
-                data_adapter.truncate_staging()
+                data_adapter.truncate_staging(plugin.SOURCE)
+            data_adapter.reset_upsert_stats()
             plugin_instance = plugin(data_adapter)
             plugin_instance.run()
-            data_adapter.publish_missing_gids()
+            # Queued rows record their missing gids on the writer threads, once they are written
             data_adapter.flush()
+            data_adapter.publish_missing_gids()
+            data_adapter.publish_upsert_stats(plugin_instance.SOURCE)
             validation_success = self.validate_consistency(plugin,
                                                            plugin_instance,
                                                            data_adapter) if self.validate_input_data else True
             self.validate_latest_timestamp(plugin, plugin_instance)
 
             if validation_success:
+                # Only a run that was written and validated moves the fetch state on
+                plugin_instance.save_fetch_state()
                 logger.info(f"Plugin {plugin.__name__} finished successfully")
 
         except Exception as ex:
@@ -0,0 +1,195 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+from typing import Dict, List, Tuple
+import pandas as pd
+
+__all__ = ('TableSchema', 'SCHEMAS', 'get_schema', 'key_columns', 'primary_key', 'TEXT', 'INTEGER', 'FLOAT', 'DATE',
+           'JSON', 'GID')
+
+TEXT = 'text'
+INTEGER = 'integer'
+FLOAT = 'float'
+DATE = 'date'
+JSON = 'json'
+# A list of GADM ids, stored as an array in Postgres and as joined text by the file adapters
+GID = 'gid'
+
+logger = logging.getLogger(__name__)
+
+LOCATION_COLUMNS = [('source', TEXT), ('date', DATE), ('country', TEXT), ('countrycode', TEXT),
+                    ('adm_area_1', TEXT), ('adm_area_2', TEXT), ('adm_area_3', TEXT)]
+
+LOCATION_KEY = ['source', 'date', 'country', 'countrycode', 'adm_area_1', 'adm_area_2', 'adm_area_3']
+
+NOT_NULL = ['source', 'date', 'country', 'countrycode']
+
+
+def to_text(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+class TableSchema:
+    """
+    Column names and types of a table, its key and the columns that can't be null.
+    Adapters derive their DDL, column lists and conflict keys from it.
+    """
+
+    def __init__(self, table_name: str, columns: List[Tuple[str, str]], key: List[str], not_null: List[str]):
+        self.table_name = table_name
+        self.types = dict(columns)
+        self.key = key
+        self.not_null = not_null
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.types.keys())
+
+    @property
+    def data_keys(self) -> List[str]:
+        # Columns updated when a row with the same key exists
+        return [column for column in self.types if column not in self.key]
+
+    def sqlite_ddl(self) -> str:
+        columns = [f"{column} {TEXT if column_type == GID else column_type} "
+                   f"{'NOT NULL' if column in self.not_null else 'DEFAULT NULL'}"
+                   for column, column_type in self.types.items()]
+        key = ", ".join(self.key)
+        return "\n    CREATE TABLE IF NOT EXISTS {table_name} (\n        {columns},\n" \
+               "        UNIQUE ({key}) ON CONFLICT REPLACE,\n        PRIMARY KEY ({key})\n" \
+               "    ) WITHOUT ROWID".format(table_name=self.table_name, columns=",\n        ".join(columns), key=key)
+
+    def coerce_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Converts whole columns to the table types, gid lists and columns the table doesn't define are left as
+        # they are
+        for column in df.columns:
+            column_type = self.types.get(column)
+            if column_type == DATE:
+                df[column] = pd.to_datetime(df[column])
+            elif column_type == INTEGER:
+                numbers = self.to_numeric(df, column)
+                self.log_changed(column, df[column], numbers.notna() & (numbers != numbers.round()), 'rounded')
+                df[column] = numbers.round().astype('Int64')
+            elif column_type == FLOAT:
+                df[column] = self.to_numeric(df, column).astype('float64')
+            elif column_type in (TEXT, JSON):
+                values = df[column]
+                df[column] = values.map(to_text, na_action='ignore').astype(object).where(values.notna(), None)
+        return df
+
+    def to_numeric(self, df: pd.DataFrame, column: str) -> pd.Series:
+        numbers = pd.to_numeric(df[column], errors='coerce')
+        self.log_changed(column, df[column], df[column].notna() & numbers.isna(), 'not numeric, stored as null')
+        return numbers
+
+    def log_changed(self, column: str, values: pd.Series, changed: pd.Series, change: str):
+        if changed.any():
+            examples = list(values[changed].astype(str).unique()[:10])
+            logger.warning(f'{self.table_name}.{column}: {changed.sum()} values {change}, e.g. {examples}')
+
+    def coerce_records(self, records: List[Dict]) -> pd.DataFrame:
+        return self.coerce_frame(pd.DataFrame.from_records(records))
+
+
+SCHEMAS = {schema.table_name: schema for schema in [
+    TableSchema('epidemiology', LOCATION_COLUMNS + [
+        ('gid', GID), ('tested', INTEGER), ('confirmed', INTEGER), ('recovered', INTEGER), ('dead', INTEGER),
+        ('hospitalised', INTEGER), ('hospitalised_icu', INTEGER), ('quarantined', INTEGER)
+    ], LOCATION_KEY, NOT_NULL),
+    TableSchema('epidemiology_england_msoa', LOCATION_COLUMNS + [
+        ('msoa', TEXT), ('msoa_code', TEXT), ('confirmed', INTEGER), ('dead', INTEGER), ('population', INTEGER)
+    ], LOCATION_KEY + ['msoa'], NOT_NULL + ['msoa']),
+    TableSchema('mobility', LOCATION_COLUMNS + [
+        ('gid', GID), ('transit_stations', INTEGER), ('residential', INTEGER), ('workplace', INTEGER),
+        ('parks', INTEGER), ('retail_recreation', INTEGER), ('grocery_pharmacy', INTEGER), ('transit', INTEGER),
+        ('walking', INTEGER), ('driving', INTEGER)
+    ], LOCATION_KEY, NOT_NULL),
+    TableSchema('government_response', LOCATION_COLUMNS + [
+        ('gid', GID),
+        ('c1_school_closing', INTEGER), ('c1_flag', INTEGER),
+        ('c2_workplace_closing', INTEGER), ('c2_flag', INTEGER),
+        ('c3_cancel_public_events', INTEGER), ('c3_flag', INTEGER),
+        ('c4_restrictions_on_gatherings', INTEGER), ('c4_flag', INTEGER),
+        ('c5_close_public_transport', INTEGER), ('c5_flag', INTEGER),
+        ('c6_stay_at_home_requirements', INTEGER), ('c6_flag', INTEGER),
+        ('c7_restrictions_on_internal_movement', INTEGER), ('c7_flag', INTEGER),
+        ('c8_international_travel_controls', INTEGER),
+        ('e1_income_support', INTEGER), ('e1_flag', INTEGER),
+        ('e2_debtcontract_relief', INTEGER),
+        ('e3_fiscal_measures', FLOAT),
+        ('e4_international_support', FLOAT),
+        ('h1_public_information_campaigns', INTEGER), ('h1_flag', INTEGER),
+        ('h2_testing_policy', INTEGER),
+        ('h3_contact_tracing', INTEGER),
+        ('h4_emergency_investment_in_healthcare', FLOAT),
+        ('h5_investment_in_vaccines', FLOAT),
+        ('m1_wildcard', TEXT),
+        ('stringency_index', FLOAT),
+        ('stringency_indexfordisplay', FLOAT),
+        ('stringency_legacy_index', FLOAT),
+        ('stringency_legacy_indexfordisplay', FLOAT),
+        ('government_response_index', FLOAT),
+        ('government_response_index_for_display', FLOAT),
+        ('containment_health_index', FLOAT),
+        ('containment_health_index_for_display', FLOAT),
+        ('economic_support_index', FLOAT),
+        ('economic_support_index_for_display', FLOAT),
+        ('actions', JSON)
+    ], LOCATION_KEY, NOT_NULL),
+    TableSchema('weather', LOCATION_COLUMNS[:2] + [('gid', GID)] + LOCATION_COLUMNS[2:] + [
+        ('samplesize', INTEGER)
+    ] + [
+        (f'{measure}_{statistic}', FLOAT)
+        for measure in ['precipitation_max', 'precipitation_mean', 'humidity_max', 'humidity_mean', 'humidity_min',
+                        'sunshine_max', 'sunshine_mean', 'temperature_max', 'temperature_mean', 'temperature_min',
+                        'windgust_max', 'windgust_mean', 'windgust_min', 'windspeed_max', 'windspeed_mean',
+                        'windspeed_min']
+        for statistic in ['avg', 'std']
+    ] + [
+        (f'{measure}_{statistic}', FLOAT)
+        for measure in ['cloudaltitude_max', 'cloudaltitude_min', 'cloudaltitude_mean']
+        for statistic in ['valid', 'avg', 'std']
+    ] + [
+        (f'{measure}_{statistic}', FLOAT)
+        for measure in ['cloudfrac_max', 'cloudfrac_min', 'cloudfrac_mean']
+        for statistic in ['avg', 'std']
+    ], ['gid', 'date'], NOT_NULL + ['gid']),
+    TableSchema('diagnostics', [
+        ('table_name', TEXT), ('source', TEXT), ('validation_success', TEXT), ('error', TEXT),
+        ('last_run_start', DATE), ('last_run_stop', DATE), ('first_timestamp', DATE), ('last_timestamp', DATE),
+        ('details', TEXT)
+    ], ['table_name', 'source'], ['table_name', 'source']),
+]}
+
+
+def get_schema(table_name: str) -> TableSchema:
+    # Staging tables have the columns of the table they are validated against
+    if table_name not in SCHEMAS and table_name.startswith('staging_'):
+        table_name = table_name[len('staging_'):]
+    if table_name not in SCHEMAS:
+        raise ValueError(f'Unknown table: {table_name}')
+    return SCHEMAS[table_name]
+
+
+def key_columns(table_name: str) -> List[str]:
+    # The key within one source, e.g. for adapters writing every source to files of its own
+    return [column for column in get_schema(table_name).key if column != 'source']
+
+
+def primary_key(table_name: str, data: Dict) -> Tuple:
+    return tuple(data.get(column) for column in key_columns(table_name))
@@ -0,0 +1,61 @@
+# Copyright (C) 2020 University of Oxford
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+import threading
+from typing import Callable
+
+from utils.country_codes_translator.translator import CountryCodesTranslator, TRANSLATION_CSV
+from utils.administrative_division_translator.translator import AdmTranslator, matches_csv_fname
+
+__all__ = ('TranslationRegistry', 'translation_registry')
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationRegistry:
+    """
+    Loads every translation file once per process and shares the translator, with its lookup cache,
+    between all fetcher instances. A translator is loaded again when the modification time of its file changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.translators = dict()
+
+    def get(self, translation_csv_fname: str, loader: Callable):
+        path = os.path.abspath(translation_csv_fname)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        with self.lock:
+            loaded_mtime, translator = self.translators.get(path, (None, None))
+            if translator is None or loaded_mtime != mtime:
+                logger.debug(f'Loading translations from {path}')
+                translator = loader()
+                self.translators[path] = (mtime, translator)
+            return translator
+
+    def adm_translator(self, translation_csv_fname: str) -> AdmTranslator:
+        return self.get(translation_csv_fname, lambda: AdmTranslator(
+            translation_csv_fname, matches_csv_fname(translation_csv_fname)))
+
+    def country_codes_translator(self) -> CountryCodesTranslator:
+        return self.get(TRANSLATION_CSV, CountryCodesTranslator)
+
+    def clear(self):
+        with self.lock:
+            self.translators = dict()
+
+
+translation_registry = TranslationRegistry()